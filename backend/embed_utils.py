@@ -46,6 +46,8 @@ EMBEDDING_MODELS = {
 
 # Default model configuration
 DEFAULT_MODEL_ID = 'bge-base'
+# Texts per forward pass when embedding in bulk
+EMBED_BATCH_SIZE = 32
 _current_model_id = DEFAULT_MODEL_ID
 _current_model: Optional[SentenceTransformer] = None
 
@@ -96,25 +98,40 @@ def get_embedding(text: str, model_id: str = None) -> np.ndarray:
     Returns:
         numpy.ndarray: Embedding vector (dimension depends on model)
     """
+    return get_embeddings([text], model_id)[0]
+
+def get_embeddings(texts: list[str], model_id: str = None, batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """Generate embeddings for several texts, batch_size texts per forward pass.
+    
+    Args:
+        texts: Texts to embed
+        model_id: Optional model ID to use (defaults to current model)
+        batch_size: Texts encoded together per forward pass
+    
+    Returns:
+        numpy.ndarray: Embedding matrix of shape (len(texts), dimension)
+    """
     model = load_embedding_model(model_id)
     config = get_model_config(model_id)
+    expected_dim = config['dimension']
+    
+    if not texts:
+        return np.empty((0, expected_dim), dtype=np.float32)
     
     # Truncate very long texts to avoid memory issues
     max_length = 512  # Standard max token length
-    if len(text) > max_length * 4:  # rough char estimate
-        text = text[:max_length * 4]
+    texts = [text[:max_length * 4] for text in texts]  # rough char estimate
     
-    embedding = model.encode([text])[0]
+    embeddings = model.encode(texts, batch_size=batch_size)
     
     # Validate dimension to catch configuration issues early
-    expected_dim = config['dimension']
-    if len(embedding) != expected_dim:
+    if embeddings.shape[1] != expected_dim:
         raise ValueError(
-            f"Embedding dimension mismatch! Expected {expected_dim}, got {len(embedding)}. "
+            f"Embedding dimension mismatch! Expected {expected_dim}, got {embeddings.shape[1]}. "
             f"Model: {config['name']}"
         )
     
-    return embedding
+    return embeddings
 
 def rerank_passages(query: str, passages: list[str], top_k: int = None) -> list[tuple[int, float]]:
     """Re-rank passages using cross-encoder for better relevance scoring.
@@ -134,12 +151,12 @@ def rerank_passages(query: str, passages: list[str], top_k: int = None) -> list[
     pairs = [[query, passage] for passage in passages]
     
     # Get relevance scores
-    scores = reranker.predict(pairs)
-    
-    # Sort by score (descending) and return indices with scores
-    ranked = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)
+    scores = np.asarray(reranker.predict(pairs))
     
-    if top_k:
-        ranked = ranked[:top_k]
+    # Select the top_k scores without sorting the rest, then sort just those (descending)
+    candidates = np.arange(len(scores))
+    if top_k and top_k < len(scores):
+        candidates = np.argpartition(scores, -top_k)[-top_k:]
+    order = candidates[np.argsort(-scores[candidates], kind="stable")]
     
-    return ranked
+    return [(int(i), scores[i]) for i in order]
@@ -3,8 +3,6 @@
 from backend.zotero_dbase import ZoteroLibrary
 from backend.zoteroitem import ZoteroItem
 from backend.pdf import PDF
-from backend.vector_db import ChromaClient
-from backend.embed_utils import get_embedding, rerank_passages
 from backend.model_providers import ProviderManager, Message
 from backend.model_providers.base import (
     ResponseValidator, 
@@ -16,10 +14,17 @@ from backend.model_providers.base import (
 from backend.conversation_store import ConversationStore
 from backend.academic_prompts import AcademicPrompts, AcademicGenerationParams
 from backend.query_condenser import QueryCondenser
+from backend.metadata_migration import (
+    cap_delimited_values,
+    MAX_TAGS_PER_CHUNK,
+    MAX_COLLECTIONS_PER_CHUNK,
+)
 import os
 import re
+from bisect import bisect_right
 from collections import OrderedDict
-from typing import Dict, Optional
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
 import threading
 import time
 import logging
@@ -27,6 +32,58 @@ import logging
 # Initialize logger for this module
 logger = logging.getLogger(__name__)
 
+# Context window scaling tiers: a context of at least _CONTEXT_THRESHOLDS[i] tokens
+# gets _CONTEXT_MULTIPLIERS[i + 1]; anything smaller (or unknown) gets 1.0
+_CONTEXT_THRESHOLDS = (
+    32000,      # Small-Med: 32k tokens (GPT-4)
+    100000,     # Medium: 100k tokens (GPT-4 Turbo)
+    200000,     # Large: 200k tokens (Claude Opus)
+    1000000,    # XLarge: 1M+ tokens (Gemini 1.5 Pro)
+)
+_CONTEXT_MULTIPLIERS = (1.0, 2.0, 3.0, 4.0, 5.0)
+
+# Base limits (conservative for small-context models), keyed by is_focused
+_BASE_RETRIEVAL_LIMITS = {
+    True: {
+        "retrieval_k": 25,
+        "rerank_top_k": 15,
+        "max_snippets_per_paper": 8,
+        "max_total_snippets": 10,
+    },
+    False: {
+        "retrieval_k": 15,
+        "rerank_top_k": 10,
+        "max_snippets_per_paper": 3,
+        "max_total_snippets": 6,
+    },
+}
+
+
+# Scaled limits for every (tier, is_focused) pair, built once; read-only since they are shared
+_RETRIEVAL_LIMIT_PRESETS = {
+    (tier, is_focused): MappingProxyType(
+        {key: int(value * multiplier) for key, value in base.items()}
+    )
+    for tier, multiplier in enumerate(_CONTEXT_MULTIPLIERS)
+    for is_focused, base in _BASE_RETRIEVAL_LIMITS.items()
+}
+
+
+def compute_retrieval_limits(context_length: Optional[int], is_focused: bool = False) -> Mapping[str, int]:
+    """
+    Scale the base retrieval limits by the tier of a model's context window.
+
+    Args:
+        context_length: Context window in tokens, or None if unknown
+        is_focused: Whether this is a focused query (filters active or ≤2 papers)
+
+    Returns:
+        Read-only mapping with retrieval_k, rerank_top_k, max_snippets_per_paper, max_total_snippets
+    """
+    tier = bisect_right(_CONTEXT_THRESHOLDS, context_length) if context_length else 0
+    return _RETRIEVAL_LIMIT_PRESETS[(tier, bool(is_focused))]
+
+
 class ZoteroChatbot:
     def __init__(
         self, 
@@ -35,12 +92,22 @@ class ZoteroChatbot:
         active_provider_id="ollama",
         active_model=None,
         credentials=None,
-        embedding_model_id="bge-base"
+        embedding_model_id="bge-base",
+        *,
+        zlib=None,
+        chroma=None,
+        conversation_store=None,
+        query_condenser=None,
     ):
-        self.zlib = ZoteroLibrary(db_path)
+        # Collaborators can be injected pre-built (e.g. by tests); otherwise they are built here
+        self.zlib = zlib if zlib is not None else ZoteroLibrary(db_path)
         self.embedding_model_id = embedding_model_id
         # Pass embedding model ID to ChromaClient so it creates model-specific collections
-        self.chroma = ChromaClient(chroma_path, embedding_model_id=embedding_model_id)
+        if chroma is None:
+            # Imported here so chromadb (and the embedding models) only load when actually used
+            from backend.vector_db import ChromaClient
+            chroma = ChromaClient(chroma_path, embedding_model_id=embedding_model_id)
+        self.chroma = chroma
         
         # Initialize provider manager for LLM interactions
         self.provider_manager = ProviderManager(
@@ -49,11 +116,14 @@ class ZoteroChatbot:
             credentials=credentials or {}
         )
         
+        # Context window per (provider_id, model_id), looked up lazily from the provider
+        self._context_length_cache: Dict[Tuple[str, str], Optional[int]] = {}
+        
         # Initialize conversation store for stateful chat
-        self.conversation_store = ConversationStore()
+        self.conversation_store = conversation_store if conversation_store is not None else ConversationStore()
         
         # Initialize query condenser for follow-up question handling
-        self.query_condenser = QueryCondenser(self.provider_manager)
+        self.query_condenser = query_condenser if query_condenser is not None else QueryCondenser(self.provider_manager)
         
         # Indexing state for reporting progress via /index_status
         self.is_indexing = False
@@ -85,6 +155,8 @@ class ZoteroChatbot:
         if credentials:
             for provider_id, creds in credentials.items():
                 self.provider_manager.set_credentials(provider_id, creds)
+            # New credentials may expose a different model list
+            self._context_length_cache.clear()
 
     def get_active_model_context_length(self) -> Optional[int]:
         """
@@ -92,28 +164,32 @@ class ZoteroChatbot:
 
         Returns:
             Context length in tokens, or None if not available
+
+        Successful lookups are cached per (provider, model), so only the first
+        chat turn after a switch queries the provider.
         """
         try:
-            provider = self.provider_manager.get_active_provider()
+            provider_id = self.provider_manager.active_provider_id
             model_id = self.provider_manager.get_active_model()
-            creds = self.provider_manager.get_credentials(self.provider_manager.active_provider_id)
-
-            # Get available models from provider
-            models = provider.list_models(creds)
+            key = (provider_id, model_id)
+            if key in self._context_length_cache:
+                return self._context_length_cache[key]
 
-            # Find the active model
-            model_info = next(
-                (m for m in models if m.id == model_id),
-                None
-            )
+            provider = self.provider_manager.get_active_provider()
+            creds = self.provider_manager.get_credentials(provider_id)
 
-            return model_info.context_length if model_info else None
+            model_info = provider.get_model_info(creds, model_id)
+            context_length = model_info.context_length if model_info else None
+            # Misses are retried, so a model the provider lists later is picked up
+            if context_length is not None:
+                self._context_length_cache[key] = context_length
+            return context_length
         except Exception as e:
             # Log but don't fail - fall back to conservative defaults
             logger.debug(f"Could not determine model context length: {e}")
             return None
 
-    def get_retrieval_limits(self, is_focused: bool = False) -> Dict[str, int]:
+    def get_retrieval_limits(self, is_focused: bool = False) -> Mapping[str, int]:
         """
         Calculate appropriate retrieval limits based on active model's context window.
 
@@ -121,63 +197,23 @@ class ZoteroChatbot:
             is_focused: Whether this is a focused query (filters active or ≤2 papers)
 
         Returns:
-            Dict with retrieval_k, rerank_top_k, max_snippets_per_paper, max_total_snippets
+            Read-only mapping with retrieval_k, rerank_top_k, max_snippets_per_paper, max_total_snippets
         """
         context_length = self.get_active_model_context_length()
-
-        # Define scaling tiers based on context window
-        # Format: (max_context, base_multiplier)
-        tiers = [
-            (1000000, 5.0),   # XLarge: 1M+ tokens (Gemini 1.5 Pro)
-            (200000, 4.0),    # Large: 200k tokens (Claude Opus)
-            (100000, 3.0),    # Medium: 100k tokens (GPT-4 Turbo)
-            (32000, 2.0),     # Small-Med: 32k tokens (GPT-4)
-            (0, 1.0),         # Default: Unknown/small context
-        ]
-
-        # Find appropriate tier
-        multiplier = 1.0
-        if context_length:
-            for threshold, mult in tiers:
-                if context_length >= threshold:
-                    multiplier = mult
-                    break
-
-        # Base limits (conservative for small-context models)
-        if is_focused:
-            base = {
-                "retrieval_k": 25,
-                "rerank_top_k": 15,
-                "max_snippets_per_paper": 8,
-                "max_total_snippets": 10,
-            }
-        else:
-            base = {
-                "retrieval_k": 15,
-                "rerank_top_k": 10,
-                "max_snippets_per_paper": 3,
-                "max_total_snippets": 6,
-            }
-
-        # Scale limits by multiplier
-        scaled = {
-            "retrieval_k": int(base["retrieval_k"] * multiplier),
-            "rerank_top_k": int(base["rerank_top_k"] * multiplier),
-            "max_snippets_per_paper": int(base["max_snippets_per_paper"] * multiplier),
-            "max_total_snippets": int(base["max_total_snippets"] * multiplier),
-        }
+        scaled = compute_retrieval_limits(context_length, is_focused)
 
         # Log for debugging
         provider_id = self.provider_manager.active_provider_id
         model_id = self.provider_manager.get_active_model()
         logger.info(
             f"Retrieval limits for {provider_id}/{model_id} "
-            f"(context: {context_length or 'unknown'}): {scaled}"
+            f"(context: {context_length or 'unknown'}): {dict(scaled)}"
         )
 
         return scaled
 
     def _index_library_worker(self):
+        from backend.embed_utils import get_embeddings
         try:
             start_time = time.time()
             self.index_progress["start_time"] = start_time
@@ -234,7 +270,10 @@ class ZoteroChatbot:
                 
                 chunks = [c['text'] for c in chunks_with_pages]
                 try:
-                    vectors = [get_embedding(chunk, self.embedding_model_id) for chunk in chunks]
+                    # Chunks embedded by an earlier run are read back from the embedding cache
+                    vectors = self.chroma.embed_chunks_cached(
+                        chunks, lambda batch: get_embeddings(batch, self.embedding_model_id)
+                    )
                 except Exception as e:
                     skip_reason = f"Item {item.metadata.get('item_id')}: Embedding generation failed - {str(e)}"
                     print(f"ERROR: {skip_reason}")
@@ -245,7 +284,7 @@ class ZoteroChatbot:
                 # Validate embedding dimensions
                 from backend.embed_utils import get_embedding_dimension
                 expected_dim = get_embedding_dimension(self.embedding_model_id)
-                if vectors and len(vectors[0]) != expected_dim:
+                if len(vectors) and len(vectors[0]) != expected_dim:
                     skip_reason = f"Item {item.metadata.get('item_id')}: Unexpected embedding dimension {len(vectors[0])}, expected {expected_dim}"
                     print(f"ERROR: {skip_reason}")
                     self.index_progress["skip_reasons"].append(skip_reason)
@@ -260,8 +299,8 @@ class ZoteroChatbot:
                 meta_src = item.metadata
                 title = meta_src.get("title") or ""
                 authors = meta_src.get("authors") or ""
-                tags = meta_src.get("tags") or ""
-                collections = meta_src.get("collections") or ""
+                tags = cap_delimited_values(meta_src.get("tags"), MAX_TAGS_PER_CHUNK)
+                collections = cap_delimited_values(meta_src.get("collections"), MAX_COLLECTIONS_PER_CHUNK)
                 item_type = meta_src.get("item_type") or ""
                 
                 # Parse year as integer (supports format like "2020-01-15" or just "2020")
@@ -341,6 +380,7 @@ class ZoteroChatbot:
 
     def _index_library_incremental_worker(self):
         """Index only new items that aren't already in the database."""
+        from backend.embed_utils import get_embeddings
         try:
             start_time = time.time()
             self.index_progress["start_time"] = start_time
@@ -412,7 +452,9 @@ class ZoteroChatbot:
                 
                 chunks = [c['text'] for c in chunks_with_pages]
                 try:
-                    vectors = [get_embedding(chunk, self.embedding_model_id) for chunk in chunks]
+                    vectors = self.chroma.embed_chunks_cached(
+                        chunks, lambda batch: get_embeddings(batch, self.embedding_model_id)
+                    )
                 except Exception as e:
                     skip_reason = f"Item {item.metadata.get('item_id')}: Embedding generation failed - {str(e)}"
                     print(f"ERROR: {skip_reason}")
@@ -422,7 +464,7 @@ class ZoteroChatbot:
                 
                 from backend.embed_utils import get_embedding_dimension
                 expected_dim = get_embedding_dimension(self.embedding_model_id)
-                if vectors and len(vectors[0]) != expected_dim:
+                if len(vectors) and len(vectors[0]) != expected_dim:
                     skip_reason = f"Item {item.metadata.get('item_id')}: Unexpected embedding dimension {len(vectors[0])}, expected {expected_dim}"
                     print(f"ERROR: {skip_reason}")
                     self.index_progress["skip_reasons"].append(skip_reason)
@@ -435,8 +477,8 @@ class ZoteroChatbot:
                 meta_src = item.metadata
                 title = meta_src.get("title") or ""
                 authors = meta_src.get("authors") or ""
-                tags = meta_src.get("tags") or ""
-                collections = meta_src.get("collections") or ""
+                tags = cap_delimited_values(meta_src.get("tags"), MAX_TAGS_PER_CHUNK)
+                collections = cap_delimited_values(meta_src.get("collections"), MAX_COLLECTIONS_PER_CHUNK)
                 item_type = meta_src.get("item_type") or ""
                 
                 # Parse year as integer (supports format like "2020-01-15" or just "2020")
@@ -828,6 +870,7 @@ class ZoteroChatbot:
 
         # RE-RANK using cross-encoder for better relevance
         if docs:
+            from backend.embed_utils import rerank_passages
             ranked = rerank_passages(retrieval_query, docs, top_k=rerank_top_k)  # Use condensed query for ranking!
             docs = [docs[idx] for idx, score in ranked]
             metas = [metas[idx] for idx, score in ranked]
@@ -808,8 +808,9 @@ async def metadata_migrate(background_tasks: BackgroundTasks):
         migration = MetadataMigration(chatbot.chroma, chatbot.zlib)
         summary = migration.migrate_all_metadata()
         
-        # Clear the cached version so next check will re-detect
-        manager._cached_version = None
+        # Upgrade the format of chunks the Zotero refresh could not update (e.g. items
+        # since removed from Zotero); this also clears the cached version for re-detection
+        summary["format_upgraded_chunks"] = manager.migrate_v1_to_v2()
         
         return {
             "status": "completed",
@@ -837,6 +838,7 @@ async def metadata_sync():
     """
     try:
         from backend.metadata_migration import MetadataMigration
+        from backend.metadata_version import invalidate_metadata_version_cache
         import logging
         logger = logging.getLogger(__name__)
         
@@ -845,6 +847,7 @@ async def metadata_sync():
         # Use the migration class to update metadata (it fetches fresh data from Zotero)
         migration = MetadataMigration(chatbot.chroma, chatbot.zlib)
         summary = migration.migrate_all_metadata()
+        invalidate_metadata_version_cache(chatbot.chroma)
         
         logger.info(f"[metadata_sync] Sync completed: {summary}")
         
@@ -1415,7 +1418,9 @@ def activate_profile(profile_id: str):
         
         # Reinitialize chatbot with new profile
         global chatbot
+        old_chatbot = chatbot
         chatbot = initialize_chatbot()
+        old_chatbot.chroma.close()
         
         return {
             "success": True,
@@ -1527,7 +1532,9 @@ def update_settings(settings: dict = Body(...)):
                             active = profile_manager.get_active_profile()
                             profile_chroma_path = profile_manager.get_profile_chroma_path(active['id'])
                             chroma_path = updated_settings.get("chromaPath", profile_chroma_path)
+                            old_chroma = chatbot.chroma
                             chatbot.chroma = ChromaClient(chroma_path, embedding_model_id=new_embedding_model)
+                            old_chroma.close()
                         else:
                             print(f"Embedding model unchanged: {chatbot.embedding_model_id}")
                 except Exception as e:
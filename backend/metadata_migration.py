@@ -3,27 +3,111 @@ Migrate ChromaDB metadata from legacy format to current format.
 Updates metadata in-place without re-embedding documents.
 """
 
+import os
 import re
 import time
-from typing import Dict, List, Any, Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Set
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Upper bounds on list-valued metadata written to ChromaDB. Tags and collections arrive
+# from Zotero as a single delimited string (SQLite GROUP_CONCAT uses ","), and every
+# client-side $contains filter scans the whole string, so unbounded values slow down filtering.
+MAX_TAGS_PER_CHUNK = int(os.getenv("MAX_TAGS_PER_CHUNK", "100"))
+MAX_COLLECTIONS_PER_CHUNK = int(os.getenv("MAX_COLLECTIONS_PER_CHUNK", "50"))
+# "KEEP" keeps the first N values, "FIFO" keeps the last N (dropping the oldest)
+METADATA_LIMIT_METHOD = os.getenv("METADATA_LIMIT_METHOD", "KEEP").upper()
+METADATA_LIST_SEPARATOR = ","
+
+# Four-digit year from 1900-2099 anywhere in a Zotero date string ("2020-01-15", "March 2020")
+_YEAR_RE = re.compile(r'\b(19|20)\d{2}\b')
+
+
+def parse_year(date_str: Optional[str]) -> Optional[int]:
+    """Parse the year from a Zotero date string, or None if there is none."""
+    if not date_str:
+        return None
+    match = _YEAR_RE.search(date_str)
+    return int(match.group(0)) if match else None
+
+
+def cap_delimited_values(value: Optional[str], max_values: int, method: str = METADATA_LIMIT_METHOD) -> str:
+    """
+    Limit a delimited metadata string to at most max_values entries.
+    
+    Args:
+        value: Delimited string such as "NLP,ML,CV" (None is treated as empty)
+        max_values: Maximum number of entries to keep (<= 0 disables the cap)
+        method: "KEEP" keeps the first entries, "FIFO" keeps the last entries
+    
+    Returns:
+        The (possibly truncated) delimited string
+    """
+    if not value or max_values <= 0 or value.count(METADATA_LIST_SEPARATOR) < max_values:
+        return value or ""
+    
+    values = value.split(METADATA_LIST_SEPARATOR)
+    kept = values[-max_values:] if method == "FIFO" else values[:max_values]
+    return METADATA_LIST_SEPARATOR.join(kept)
+
+
+@dataclass(slots=True)
+class MigrationProgress:
+    """Running counters for a metadata migration.
+    
+    Supports dict-style access (progress["failed_chunks"]) for backward compatibility.
+    """
+    total_chunks: int = 0
+    processed_chunks: int = 0
+    updated_chunks: int = 0
+    failed_chunks: int = 0
+    start_time: Optional[float] = None
+    items_processed: Set[str] = field(default_factory=set)
+    
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+
+@dataclass(slots=True)
+class ItemMetadata:
+    """Current Zotero metadata for one item, as cached during migration."""
+    title: str = ""
+    authors: str = ""
+    tags: str = ""
+    collections: str = ""
+    year: Optional[int] = None
+    item_type: str = ""
+    
+    @classmethod
+    def from_zotero_item(cls, item) -> "ItemMetadata":
+        """Build from a Zotero library item (ZoteroItem or dict), parsing the year to an int."""
+        return cls(
+            title=item.get("title", ""),
+            authors=item.get("authors", ""),
+            tags=cap_delimited_values(item.get("tags"), MAX_TAGS_PER_CHUNK),
+            collections=cap_delimited_values(item.get("collections"), MAX_COLLECTIONS_PER_CHUNK),
+            year=parse_year(item.get("date")),
+            item_type=item.get("item_type", ""),
+        )
+
+
 class MetadataMigration:
     """Migrate ChromaDB metadata to current format."""
     
     def __init__(self, chroma_client, zotero_library):
         self.chroma = chroma_client
         self.zlib = zotero_library
-        self.progress = {
-            "total_chunks": 0,
-            "processed_chunks": 0,
-            "updated_chunks": 0,
-            "failed_chunks": 0,
-            "start_time": None,
-            "items_processed": set(),
-        }
+        self.progress = MigrationProgress()
     
     def migrate_all_metadata(self, batch_size: int = 1000) -> Dict[str, Any]:
         """
@@ -36,7 +120,7 @@ class MetadataMigration:
             Migration summary with counts and errors
         """
         logger.info("Starting metadata migration...")
-        self.progress["start_time"] = time.time()
+        self.progress.start_time = time.time()
         
         # Get all chunks from ChromaDB
         logger.info("Fetching chunks from ChromaDB...")
@@ -48,7 +132,7 @@ class MetadataMigration:
         chunk_ids = all_results.get('ids', [])
         metadatas = all_results.get('metadatas', [])
         
-        self.progress["total_chunks"] = len(chunk_ids)
+        self.progress.total_chunks = len(chunk_ids)
         logger.info(f"Found {len(chunk_ids)} chunks to process")
         
         if len(chunk_ids) == 0:
@@ -70,25 +154,9 @@ class MetadataMigration:
             logger.info(f"Fetched {len(zotero_items)} items from Zotero")
             
             # Convert to lookup dict by item_id
-            item_metadata_cache = {}
+            item_metadata_cache: Dict[str, ItemMetadata] = {}
             for item in zotero_items:
-                item_id = str(item['item_id'])
-                # Parse year to integer
-                year_str = item.get("date", "")
-                year_int = None
-                if year_str:
-                    match = re.search(r'\b(19|20)\d{2}\b', year_str)
-                    if match:
-                        year_int = int(match.group(0))
-                
-                item_metadata_cache[item_id] = {
-                    "title": item.get("title", ""),
-                    "authors": item.get("authors", ""),
-                    "tags": item.get("tags", ""),
-                    "collections": item.get("collections", ""),
-                    "year": year_int,
-                    "item_type": item.get("item_type", ""),
-                }
+                item_metadata_cache[str(item['item_id'])] = ItemMetadata.from_zotero_item(item)
             
             logger.info(f"Built metadata cache with {len(item_metadata_cache)} items")
             
@@ -99,7 +167,7 @@ class MetadataMigration:
                 "updated_chunks": 0,
                 "failed_chunks": len(chunk_ids),
                 "unique_items": 0,
-                "elapsed_seconds": int(time.time() - self.progress["start_time"]),
+                "elapsed_seconds": int(time.time() - self.progress.start_time),
                 "success": False,
                 "error": str(e)
             }
@@ -113,20 +181,20 @@ class MetadataMigration:
             self._migrate_batch(batch_ids, batch_metas, item_metadata_cache)
             
             # Log progress
-            if self.progress["total_chunks"] > 0:
-                progress_pct = (self.progress["processed_chunks"] / self.progress["total_chunks"]) * 100
+            if self.progress.total_chunks > 0:
+                progress_pct = (self.progress.processed_chunks / self.progress.total_chunks) * 100
                 logger.info(f"Migration progress: {progress_pct:.1f}% "
-                           f"({self.progress['processed_chunks']}/{self.progress['total_chunks']})")
+                           f"({self.progress.processed_chunks}/{self.progress.total_chunks})")
         
-        elapsed = time.time() - self.progress["start_time"]
+        elapsed = time.time() - self.progress.start_time
         
         summary = {
-            "total_chunks": self.progress["total_chunks"],
-            "updated_chunks": self.progress["updated_chunks"],
-            "failed_chunks": self.progress["failed_chunks"],
-            "unique_items": len(self.progress["items_processed"]),
+            "total_chunks": self.progress.total_chunks,
+            "updated_chunks": self.progress.updated_chunks,
+            "failed_chunks": self.progress.failed_chunks,
+            "unique_items": len(self.progress.items_processed),
             "elapsed_seconds": int(elapsed),
-            "success": self.progress["failed_chunks"] == 0,
+            "success": self.progress.failed_chunks == 0,
         }
         
         logger.info(f"Migration complete: {summary}")
@@ -136,79 +204,88 @@ class MetadataMigration:
         self,
         chunk_ids: List[str],
         metadatas: List[Dict],
-        cache: Dict[str, Dict],
+        cache: Dict[str, ItemMetadata],
     ):
         """Migrate a batch of chunks using pre-loaded metadata cache."""
         updates_needed = []
+        batch_item_fields: Dict[str, Dict[str, Any]] = {}
+        items_processed = self.progress.items_processed
+        # Count locally and write back to self.progress once per batch
+        processed = updated = failed = 0
         
         for chunk_id, old_meta in zip(chunk_ids, metadatas):
+            processed += 1
             try:
                 item_id = str(old_meta.get('item_id', ''))
                 if not item_id:
                     logger.warning(f"Chunk {chunk_id} has no item_id, skipping")
-                    self.progress["failed_chunks"] += 1
-                    self.progress["processed_chunks"] += 1
+                    failed += 1
                     continue
                 
                 # Get updated metadata from cache (already loaded upfront)
                 if item_id not in cache:
                     logger.warning(f"Could not find metadata for item {item_id} in cache")
-                    self.progress["failed_chunks"] += 1
-                    self.progress["processed_chunks"] += 1
+                    failed += 1
                     continue
                 
-                updated_item_meta = cache[item_id]
+                # Item-level fields are identical for every chunk of an item,
+                # so build them once per unique item_id in the batch
+                item_fields = batch_item_fields.get(item_id)
+                if item_fields is None:
+                    item_fields = batch_item_fields[item_id] = self._build_item_fields(item_id, cache[item_id])
                 
                 # Build new metadata dict (preserve chunk-specific fields)
                 new_meta = {
-                    "item_id": int(item_id) if item_id.isdigit() else item_id,
                     "chunk_idx": int(old_meta.get("chunk_idx", 0)),
                     "page": int(old_meta.get("page", 0)),
                     "pdf_path": old_meta.get("pdf_path", ""),
-                    
-                    # Updated fields from Zotero
-                    "title": updated_item_meta.get("title", ""),
-                    "authors": updated_item_meta.get("authors", ""),
-                    "tags": updated_item_meta.get("tags") or "",  # Don't store None - ChromaDB strips it
-                    "collections": updated_item_meta.get("collections") or "",  # Don't store None
-                    "year": updated_item_meta.get("year"),  # Integer or None - but ChromaDB may strip None
-                    "item_type": updated_item_meta.get("item_type", ""),
+                    **item_fields,
                 }
                 
-                # CRITICAL: ChromaDB strips None values, so we need to handle that
-                # For year, if it's None, we should store it as -1 to preserve the key
-                if new_meta["year"] is None:
-                    new_meta["year"] = -1  # Sentinel value for "no year"
-                
                 # Check if update is actually needed
                 if self._needs_update(old_meta, new_meta):
                     updates_needed.append((chunk_id, new_meta))
-                    self.progress["updated_chunks"] += 1
+                    updated += 1
                 
-                self.progress["processed_chunks"] += 1
-                self.progress["items_processed"].add(item_id)
+                items_processed.add(item_id)
                 
             except Exception as e:
                 logger.error(f"Error processing chunk {chunk_id}: {e}")
-                self.progress["failed_chunks"] += 1
-                self.progress["processed_chunks"] += 1
+                failed += 1
+        
+        progress = self.progress
+        progress.processed_chunks += processed
+        progress.updated_chunks += updated
+        progress.failed_chunks += failed
         
         # Apply updates as a batch
         if updates_needed:
             logger.info(f"Applying {len(updates_needed)} updates to ChromaDB")
             self._apply_metadata_updates(updates_needed)
     
+    @staticmethod
+    def _build_item_fields(item_id: str, item_meta: ItemMetadata) -> Dict[str, Any]:
+        """Build the item-level metadata fields shared by all chunks of an item."""
+        return {
+            "item_id": int(item_id) if item_id.isdigit() else item_id,
+            
+            # Updated fields from Zotero
+            "title": item_meta.title or "",
+            "authors": item_meta.authors or "",
+            "tags": item_meta.tags or "",  # Don't store None - ChromaDB strips it
+            "collections": item_meta.collections or "",  # Don't store None
+            # CRITICAL: ChromaDB strips None values, so a missing year is stored
+            # as the sentinel -1 to preserve the key
+            "year": item_meta.year if item_meta.year is not None else -1,
+            "item_type": item_meta.item_type or "",
+        }
+    
     def _needs_update(self, old_meta: Dict, new_meta: Dict) -> bool:
         """Check if metadata actually needs updating."""
         # Check if year format changed (string -> int or None)
         old_year = old_meta.get('year')
         new_year = new_meta.get('year')
         
-        # Log first few comparisons for debugging
-        if self.progress["processed_chunks"] < 5:
-            print(f"Debug comparison - old_year: {repr(old_year)} (type: {type(old_year).__name__}), "
-                  f"new_year: {repr(new_year)} (type: {type(new_year).__name__ if new_year is not None else 'NoneType'})")
-        
         # Year needs update if it's currently a string (including empty strings)
         # and needs to be an int or None
         if isinstance(old_year, str):
@@ -243,6 +320,7 @@ class MetadataMigration:
                 ids=chunk_ids,
                 metadatas=new_metadatas,
             )
+            self.chroma.query_cache.clear()
             
             logger.debug(f"Updated {len(chunk_ids)} chunks")
             
@@ -3,11 +3,31 @@ Utilities for building ChromaDB metadata filter clauses.
 Constructs where clauses for metadata-based filtering.
 """
 
-from typing import Dict, Any, List, Optional
+import copy
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Map UI display names to Zotero internal item type names (for backward compatibility)
+_ITEM_TYPE_MAPPING = {
+    "Journal Article": "journalArticle",
+    "Book": "book",
+    "Book Section": "bookSection",
+    "Conference Paper": "conferencePaper",
+    "Thesis": "thesis",
+    "Preprint": "preprint",
+    "Web Page": "webpage",
+    "Report": "report",
+    "Presentation": "presentation",
+    "Manuscript": "manuscript",
+}
+
+# Operators accepted by validate_where_clause()
+_LOGICAL_OPS = frozenset({"$and", "$or", "$not"})
+_COMPARISON_OPS = frozenset({"$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin", "$contains"})
+
 
 def build_metadata_where_clause(
     year_min: Optional[int] = None,
@@ -55,62 +75,56 @@ def build_metadata_where_clause(
             {"$or": [{"tags": {"$contains": "NLP"}}, {"tags": {"$contains": "Transformers"}}]},
             {"title": {"$contains": "neural"}}
         ]}
+    
+    NOTE: Results are memoized per filter combination; each caller gets its own copy,
+    so modifying the returned clause does not affect later calls.
     """
+    return copy.deepcopy(_build_where_clause_cached(
+        year_min,
+        year_max,
+        tuple(tags) if tags else None,
+        tuple(collections) if collections else None,
+        title,
+        author,
+        tuple(item_types) if item_types else None,
+    ))
+
+
+@lru_cache(maxsize=512)
+def _build_where_clause_cached(
+    year_min: Optional[int],
+    year_max: Optional[int],
+    tags: Optional[Tuple[str, ...]],
+    collections: Optional[Tuple[str, ...]],
+    title: Optional[str],
+    author: Optional[str],
+    item_types: Optional[Tuple[str, ...]],
+) -> Optional[Dict[str, Any]]:
+    """Build the where clause for build_metadata_where_clause() from hashable arguments."""
     conditions = []
     
     # Year range conditions (automatically excludes year=-1)
     if year_min is not None:
         conditions.append({"year": {"$gte": year_min}})
-    
     if year_max is not None:
         conditions.append({"year": {"$lte": year_max}})
     
-    # Tags conditions (any tag matches) - uses $contains which requires client-side filtering
+    # Tags/collections (any value matches) - use $contains which requires client-side filtering
     if tags:
-        tag_conditions = [{"tags": {"$contains": tag}} for tag in tags]
-        if len(tag_conditions) == 1:
-            conditions.append(tag_conditions[0])
-        else:
-            conditions.append({"$or": tag_conditions})
-    
-    # Collections conditions (any collection matches) - uses $contains which requires client-side filtering
+        conditions.append(_any_contains("tags", tags))
     if collections:
-        coll_conditions = [{"collections": {"$contains": coll}} for coll in collections]
-        if len(coll_conditions) == 1:
-            conditions.append(coll_conditions[0])
-        else:
-            conditions.append({"$or": coll_conditions})
+        conditions.append(_any_contains("collections", collections))
     
-    # Title condition (substring match) - uses $contains which requires client-side filtering
+    # Title/author (substring match) - use $contains which requires client-side filtering
     if title:
         conditions.append({"title": {"$contains": title}})
-    
-    # Author condition (substring match) - uses $contains which requires client-side filtering
     if author:
         conditions.append({"authors": {"$contains": author}})
     
-    # Item type conditions (any type matches) - uses $in which is ChromaDB-compatible
+    # Item type conditions (any type matches) - uses $in which is ChromaDB-compatible.
+    # Display names are mapped to Zotero internal names; anything else is assumed internal already.
     if item_types:
-        # Map UI display names to Zotero internal names (for backward compatibility)
-        item_type_mapping = {
-            "Journal Article": "journalArticle",
-            "Book": "book",
-            "Book Section": "bookSection",
-            "Conference Paper": "conferencePaper",
-            "Thesis": "thesis",
-            "Preprint": "preprint",
-            "Web Page": "webpage",
-            "Report": "report",
-            "Presentation": "presentation",
-            "Manuscript": "manuscript",
-        }
-        # Convert display names to internal names
-        internal_types = []
-        for display_type in item_types:
-            # If it's a display name, map it. Otherwise assume it's already an internal name.
-            internal_type = item_type_mapping.get(display_type, display_type)
-            internal_types.append(internal_type)
-        
+        internal_types = [_ITEM_TYPE_MAPPING.get(t, t) for t in item_types]
         if len(internal_types) == 1:
             conditions.append({"item_type": {"$eq": internal_types[0]}})
         else:
@@ -119,11 +133,14 @@ def build_metadata_where_clause(
     # Combine all conditions
     if not conditions:
         return None
-    
-    if len(conditions) == 1:
-        return conditions[0]
-    
-    return {"$and": conditions}
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def _any_contains(field: str, values: Tuple[str, ...]) -> Dict[str, Any]:
+    """Build a $contains condition for one value, or an $or over several."""
+    if len(values) == 1:
+        return {field: {"$contains": values[0]}}
+    return {"$or": [{field: {"$contains": v}} for v in values]}
 
 
 def separate_where_clauses(
@@ -339,35 +356,27 @@ def validate_where_clause(where: Optional[Dict[str, Any]]) -> bool:
     Returns:
         True if valid, False otherwise
     """
-    if where is None:
-        return True
-    
-    if not isinstance(where, dict):
-        return False
-    
-    # Allowed operators
-    logical_ops = {"$and", "$or", "$not"}
-    comparison_ops = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin", "$contains"}
-    
-    # Recursive validation
-    for key, value in where.items():
-        if key in logical_ops:
-            # Logical operators should have list values
-            if not isinstance(value, list):
-                return False
-            # Recursively validate each condition
-            for condition in value:
-                if not validate_where_clause(condition):
-                    return False
-        elif key in comparison_ops:
-            # Comparison operators can have various value types
+    # Iterative depth-first walk over the clause tree (avoids a Python call per nesting level)
+    stack = [where]
+    while stack:
+        clause = stack.pop()
+        if clause is None:
             continue
-        else:
-            # Must be a field name with nested operators
-            if not isinstance(value, dict):
+        if not isinstance(clause, dict):
+            return False
+        
+        for key, value in clause.items():
+            if key in _LOGICAL_OPS:
+                # Logical operators should have list values
+                if not isinstance(value, list):
+                    return False
+                stack.extend(value)
+            elif key in _COMPARISON_OPS:
+                # Comparison operators can have various value types
                 continue
-            if not validate_where_clause(value):
-                return False
+            elif isinstance(value, dict):
+                # Field name with nested operators
+                stack.append(value)
     
     return True
 
@@ -379,6 +388,10 @@ def merge_where_clauses(
     """
     Merge two where clauses with AND logic.
     
+    Top-level $and clauses are flattened into a single $and rather than nested, which keeps
+    the predicate tree shallow and lets separate_where_clauses() split every condition
+    between ChromaDB and client-side filtering.
+    
     Args:
         clause1: First where clause
         clause2: Second where clause
@@ -395,8 +408,15 @@ def merge_where_clauses(
     if clause2 is None:
         return clause1
     
-    # Both clauses exist, combine with AND
-    return {"$and": [clause1, clause2]}
+    # Both clauses exist, combine with AND (new list - the inputs may be cached clauses)
+    return {"$and": _and_children(clause1) + _and_children(clause2)}
+
+
+def _and_children(clause: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Return the conditions of a bare $and clause, or the clause itself as a single condition."""
+    if len(clause) == 1 and "$and" in clause:
+        return list(clause["$and"])
+    return [clause]
 
 
 def format_filters_for_display(
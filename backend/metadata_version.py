@@ -5,17 +5,23 @@ Ensures backward compatibility during metadata schema changes.
 
 from typing import Optional
 import logging
+import weakref
+
+from backend.metadata_migration import parse_year
 
 logger = logging.getLogger(__name__)
 
 CURRENT_METADATA_VERSION = 2  # Version 2 = year as integer
 LEGACY_METADATA_VERSION = 1   # Version 1 = year as string
+DEFAULT_SAMPLE_SIZE = 10      # Chunks sampled to detect the format
+
 
 class MetadataVersionManager:
     """Manage ChromaDB metadata format versions."""
     
-    def __init__(self, chroma_client):
+    def __init__(self, chroma_client, sample_size: int = DEFAULT_SAMPLE_SIZE):
         self.chroma = chroma_client
+        self.sample_size = sample_size
         self._cached_version = None
     
     def detect_metadata_version(self) -> int:
@@ -31,40 +37,40 @@ class MetadataVersionManager:
             return self._cached_version
         
         try:
-            # Sample a few chunks to detect format
-            results = self.chroma.collection.get(limit=10)
-            
-            if not results or not results.get('metadatas'):
-                logger.warning("ChromaDB appears empty")
-                self._cached_version = 0
-                return 0
-            
-            # Check multiple chunks for consistency
-            version_votes = []
+            # Sample a few chunks to detect format (metadata only, in one read)
+            results = self.chroma.collection.get(limit=self.sample_size, include=['metadatas'])
+            metadatas = (results or {}).get('metadatas') or []
             
-            for meta in results['metadatas'][:10]:
-                if not meta:
-                    continue
+            # Stop voting as soon as the remaining chunks can no longer change the majority
+            v1_votes = v2_votes = 0
+            for i, meta in enumerate(metadatas):
+                if meta:
+                    year = meta.get('year')
+                    has_tags_and_collections = 'tags' in meta and 'collections' in meta
+                    
+                    # Version 2: year is int (including -1 sentinel) or missing, has tags/collections keys
+                    # Note: ChromaDB strips None values, so missing keys might indicate None was set
+                    if (isinstance(year, int) or year is None) and has_tags_and_collections:
+                        v2_votes += 1
+                    # Version 1: year is string or missing required keys
+                    elif isinstance(year, str) or not has_tags_and_collections:
+                        v1_votes += 1
                 
-                year = meta.get('year')
-                has_tags = 'tags' in meta
-                has_collections = 'collections' in meta
-                
-                # Version 2: year is int (including -1 sentinel) or missing, has tags/collections keys
-                # Note: ChromaDB strips None values, so missing keys might indicate None was set
-                if (isinstance(year, int) or year is None) and has_tags and has_collections:
-                    version_votes.append(2)
-                # Version 1: year is string or missing required keys
-                elif isinstance(year, str) or not (has_tags and has_collections):
-                    version_votes.append(1)
+                remaining = len(metadatas) - i - 1
+                # Ties go to the legacy format, so v1 only needs to not be outvoted
+                if v2_votes - v1_votes > remaining or v1_votes - v2_votes >= remaining:
+                    break
             
-            if not version_votes:
-                logger.warning("Could not determine metadata version")
+            if not (v1_votes or v2_votes):
+                if not metadatas:
+                    logger.warning("ChromaDB appears empty")
+                else:
+                    logger.warning("Could not determine metadata version")
                 self._cached_version = 0
                 return 0
             
-            # Majority vote
-            detected_version = max(set(version_votes), key=version_votes.count)
+            # Majority vote (ties go to the legacy format, so migration is offered)
+            detected_version = CURRENT_METADATA_VERSION if v2_votes > v1_votes else LEGACY_METADATA_VERSION
             self._cached_version = detected_version
             
             logger.info(f"Detected ChromaDB metadata version: {detected_version}")
@@ -75,6 +81,53 @@ class MetadataVersionManager:
             self._cached_version = 0
             return 0
     
+    def migrate_v1_to_v2(self, batch_size: Optional[int] = None) -> int:
+        """
+        Upgrade legacy chunk metadata to the current format in place.
+        
+        Only the format changes (string year -> int, missing tags/collections -> "");
+        use MetadataMigration to refresh values from Zotero.
+        
+        Args:
+            batch_size: Chunks per update call (defaults to the client's max batch size)
+        
+        Returns:
+            Number of chunks updated
+        """
+        if batch_size is None:
+            batch_size = self.chroma.chroma_client.get_max_batch_size()
+        
+        # Read one page at a time (updates keep chunk order, so paging stays aligned)
+        updated = 0
+        for page in self.chroma.iter_collection_pages(include=['metadatas']):
+            ids, metadatas = [], []
+            for chunk_id, meta in zip(page.get('ids', []), page.get('metadatas', [])):
+                if not meta:
+                    continue
+                year = meta.get('year')
+                if isinstance(year, int) and 'tags' in meta and 'collections' in meta:
+                    continue
+                
+                new_meta = dict(meta)
+                if not isinstance(year, int):
+                    parsed = parse_year(year) if isinstance(year, str) else None
+                    # ChromaDB strips None values, so a missing year is stored as -1
+                    new_meta['year'] = parsed if parsed is not None else -1
+                new_meta.setdefault('tags', "")
+                new_meta.setdefault('collections', "")
+                ids.append(chunk_id)
+                metadatas.append(new_meta)
+            
+            for i in range(0, len(ids), batch_size):
+                self.chroma.collection.update(ids=ids[i:i+batch_size], metadatas=metadatas[i:i+batch_size])
+            updated += len(ids)
+        
+        self.chroma.query_cache.clear()
+        logger.info(f"Upgraded metadata format of {updated} chunks")
+        self._cached_version = None
+        invalidate_metadata_version_cache(self.chroma)
+        return updated
+    
     def is_migration_needed(self) -> bool:
         """Check if migration is needed to use metadata filtering."""
         current_version = self.detect_metadata_version()
@@ -99,6 +152,16 @@ class MetadataVersionManager:
             return None  # Already up to date
 
 
+# Detected version per ChromaDB client, reused across check_metadata_compatibility() calls.
+# Weak keys so entries go away with their client.
+_detected_versions: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def invalidate_metadata_version_cache(chroma_client) -> None:
+    """Forget the cached metadata version of a client (call after migrating its metadata)."""
+    _detected_versions.pop(chroma_client, None)
+
+
 def check_metadata_compatibility(chroma_client, enable_filtering: bool = True) -> bool:
     """
     Check if metadata filtering can be safely enabled.
@@ -109,12 +172,18 @@ def check_metadata_compatibility(chroma_client, enable_filtering: bool = True) -
     
     Returns:
         True if filtering can be enabled, False otherwise
+    
+    The detected version is cached per client; only definitive versions (1 or 2) are
+    cached, so an empty database is re-checked once it has been indexed.
     """
     if not enable_filtering:
         return True  # No compatibility check needed
     
-    manager = MetadataVersionManager(chroma_client)
-    version = manager.detect_metadata_version()
+    version = _detected_versions.get(chroma_client)
+    if version is None:
+        version = MetadataVersionManager(chroma_client).detect_metadata_version()
+        if version:
+            _detected_versions[chroma_client] = version
     
     if version == CURRENT_METADATA_VERSION:
         logger.info("✅ Metadata format compatible with filtering")
@@ -12,7 +12,7 @@ import os
 os.environ['GRPC_VERBOSITY'] = 'ERROR'
 os.environ['GRPC_TRACE'] = ''
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from .base import (
     BaseProvider, Message, ChatResponse, ModelInfo,
     ProviderError, ProviderAuthenticationError, ProviderConnectionError,
@@ -224,6 +224,9 @@ class GoogleProvider(BaseProvider):
             supports_streaming=True,
             requires_api_key=True,
         )
+        # API key genai is currently configured with; reconfiguring drops the SDK's
+        # cached clients (and their open connections), so only do it when the key changes
+        self._configured_api_key: Optional[str] = None
     
     def _get_client(self, credentials: Dict[str, Any]):
         """Get Google Generative AI client."""
@@ -239,11 +242,13 @@ class GoogleProvider(BaseProvider):
         if not api_key:
             raise ProviderAuthenticationError("Google API key is required")
         
-        # Log SDK version for debugging
-        print(f"[Google Provider] Using google-generativeai version: {genai.__version__ if hasattr(genai, '__version__') else 'unknown'}")
-        print(f"[Google Provider] API key present: {bool(api_key)} (length: {len(api_key) if api_key else 0})")
-        
-        genai.configure(api_key=api_key)
+        if api_key != self._configured_api_key:
+            # Log SDK version for debugging
+            print(f"[Google Provider] Using google-generativeai version: {genai.__version__ if hasattr(genai, '__version__') else 'unknown'}")
+            print(f"[Google Provider] API key present: {bool(api_key)} (length: {len(api_key) if api_key else 0})")
+            
+            genai.configure(api_key=api_key)
+            self._configured_api_key = api_key
         return genai
     
     def validate_credentials(self, credentials: Dict[str, Any]) -> bool:
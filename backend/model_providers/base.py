@@ -6,20 +6,21 @@ This ensures a consistent interface regardless of whether using local models (Ol
 or cloud APIs (OpenAI, Anthropic, etc.).
 """
 
+import re
 from typing import Protocol, Dict, Any, List, Optional
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Message:
-    """Standard message format for chat interactions."""
+    """Standard message format for chat interactions (immutable, no per-instance __dict__)."""
     role: str  # "system", "user", "assistant"
     content: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ChatResponse:
-    """Normalized response from any LLM provider."""
+    """Normalized response from any LLM provider (immutable, no per-instance __dict__)."""
     content: str
     model: str
     usage: Optional[Dict[str, int]] = None  # {"prompt_tokens": X, "completion_tokens": Y}
@@ -67,11 +68,22 @@ class ProviderContextError(ProviderError):
 class MessageAdapter:
     """Adapts standard Message format to provider-specific formats."""
     
+    # Gemini uses 'model' role instead of 'assistant'; any non-user role maps to 'model'
+    GEMINI_ROLES = {"user": "user", "assistant": "model"}
+    
     @staticmethod
     def to_openai(messages: List[Message]) -> List[Dict[str, str]]:
         """Convert to OpenAI format (also used by Ollama, Mistral, Groq, OpenRouter)."""
         return [{"role": msg.role, "content": msg.content} for msg in messages]
     
+    @staticmethod
+    def _last_system_message(messages: List[Message]) -> Optional[str]:
+        """Return the content of the last system message, if any."""
+        for msg in reversed(messages):
+            if msg.role == "system":
+                return msg.content
+        return None
+    
     @staticmethod
     def to_anthropic(messages: List[Message]) -> tuple[Optional[str], List[Dict[str, str]]]:
         """
@@ -79,19 +91,12 @@ class MessageAdapter:
         Returns (system_message, conversation_messages).
         System message must be separate parameter.
         """
-        system_message = None
-        conversation_messages = []
-        
-        for msg in messages:
-            if msg.role == "system":
-                system_message = msg.content
-            else:
-                conversation_messages.append({
-                    "role": msg.role,
-                    "content": msg.content
-                })
-        
-        return system_message, conversation_messages
+        conversation_messages = [
+            {"role": msg.role, "content": msg.content}
+            for msg in messages
+            if msg.role != "system"
+        ]
+        return MessageAdapter._last_system_message(messages), conversation_messages
     
     @staticmethod
     def to_gemini(messages: List[Message]) -> tuple[Optional[str], List[Dict[str, Any]]]:
@@ -100,21 +105,13 @@ class MessageAdapter:
         Returns (system_instruction, history).
         System instruction is model parameter, history uses 'model' role instead of 'assistant'.
         """
-        system_instruction = None
-        history = []
-        
-        for msg in messages:
-            if msg.role == "system":
-                system_instruction = msg.content
-            else:
-                # Gemini uses 'model' role instead of 'assistant'
-                role = "user" if msg.role == "user" else "model"
-                history.append({
-                    "role": role,
-                    "parts": [msg.content]
-                })
-        
-        return system_instruction, history
+        roles = MessageAdapter.GEMINI_ROLES
+        history = [
+            {"role": roles.get(msg.role, "model"), "parts": [msg.content]}
+            for msg in messages
+            if msg.role != "system"
+        ]
+        return MessageAdapter._last_system_message(messages), history
 
 
 class ParameterMapper:
@@ -194,6 +191,13 @@ class ResponseValidator:
         "i can help",
     ]
     
+    # Phrases indicating an error message was returned as the answer
+    ERROR_INDICATORS = ["error:", "exception:", "failed to", "could not"]
+    
+    # Each phrase list compiled once into a single alternation, matched against lowercased content
+    _META_RESPONSE_RE = re.compile("|".join(map(re.escape, META_RESPONSE_PHRASES)))
+    _ERROR_INDICATOR_RE = re.compile("|".join(map(re.escape, ERROR_INDICATORS)))
+    
     @staticmethod
     def validate_chat_response(response: ChatResponse, provider_id: str) -> tuple[bool, List[str]]:
         """
@@ -201,19 +205,19 @@ class ResponseValidator:
         Returns (is_valid, list_of_issues).
         """
         issues = []
-        content_lower = response.content.lower().strip()
+        content_stripped = response.content.strip()
+        content_lower = content_stripped.lower()
         
         # Check for meta-responses
-        if any(phrase in content_lower for phrase in ResponseValidator.META_RESPONSE_PHRASES):
+        if ResponseValidator._META_RESPONSE_RE.search(content_lower):
             issues.append("Meta-response detected (acknowledgment instead of answer)")
         
         # Check for empty or very short responses
-        if len(response.content.strip()) < 10:
+        if len(content_stripped) < 10:
             issues.append("Response too short or empty")
         
         # Check for error messages in response
-        error_indicators = ["error:", "exception:", "failed to", "could not"]
-        if any(indicator in content_lower for indicator in error_indicators):
+        if ResponseValidator._ERROR_INDICATOR_RE.search(content_lower):
             issues.append("Error message in response content")
         
         return len(issues) == 0, issues
@@ -285,6 +289,19 @@ class ModelProvider(Protocol):
         """
         ...
     
+    def get_model_info(self, credentials: Dict[str, Any], model_id: str) -> Optional[ModelInfo]:
+        """
+        Look up a single model by ID.
+        
+        Args:
+            credentials: Provider-specific credentials
+            model_id: Model ID to look up
+            
+        Returns:
+            ModelInfo for the model, or None if the provider does not offer it
+        """
+        ...
+    
     def chat(
         self,
         credentials: Dict[str, Any],
@@ -335,6 +352,8 @@ class BaseProvider:
         self._default_model = default_model
         self._supports_streaming = supports_streaming
         self._requires_api_key = requires_api_key
+        # Model ID -> ModelInfo, built from list_models() on first lookup
+        self._model_index: Dict[str, ModelInfo] = {}
     
     @property
     def id(self) -> str:
@@ -356,6 +375,14 @@ class BaseProvider:
     def requires_api_key(self) -> bool:
         return self._requires_api_key
     
+    def get_model_info(self, credentials: Dict[str, Any], model_id: str) -> Optional[ModelInfo]:
+        """Look up a model by ID, (re)building the index from list_models() on a miss."""
+        info = self._model_index.get(model_id)
+        if info is None:
+            self._model_index = {m.id: m for m in self.list_models(credentials)}
+            info = self._model_index.get(model_id)
+        return info
+    
     def _check_credentials(self, credentials: Dict[str, Any], required_keys: List[str]):
         """Helper to validate required credential keys are present."""
         missing = [key for key in required_keys if not credentials.get(key)]
@@ -0,0 +1,144 @@
+"""
+Dynamic batching of dense (HNSW) queries.
+
+Each collection.query() call has a fixed overhead, so concurrent queries arriving
+within a short window are coalesced into one call with several query embeddings
+and the per-query results are handed back to their callers.
+"""
+
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_MAX_BATCH = 32
+DEFAULT_DISPATCH_TIMEOUT_MS = 2.0
+
+
+class _Request:
+    __slots__ = ("query_embeddings", "n_results", "where", "future")
+
+    def __init__(self, query_embeddings, n_results: int, where: Optional[Dict[str, Any]]):
+        self.query_embeddings = list(query_embeddings)
+        self.n_results = n_results
+        self.where = where
+        self.future: Future = Future()
+
+
+class BatchedQueryDispatcher:
+    """
+    Coalesce concurrent dense queries into batched query calls.
+
+    A request arriving at an idle dispatcher is sent at once. Requests that queue
+    up behind it are collected for up to `dispatch_timeout_ms` (or until
+    `max_batch` are waiting). Requests with the same `where` filter share one
+    call with n_results set to the largest requested k; each caller gets back
+    its own rows, truncated to its k.
+    """
+
+    def __init__(
+        self,
+        query_fn: Callable[..., Dict[str, Any]],
+        max_batch: int = DEFAULT_MAX_BATCH,
+        dispatch_timeout_ms: float = DEFAULT_DISPATCH_TIMEOUT_MS,
+    ):
+        """
+        Args:
+            query_fn: Called as query_fn(query_embeddings=..., n_results=..., where=...),
+                e.g. a ChromaDB collection's query method
+            max_batch: Maximum number of requests coalesced into one dispatch
+            dispatch_timeout_ms: How long to wait for more requests after the first
+        """
+        self.query_fn = query_fn
+        self.max_batch = max_batch
+        self.dispatch_timeout = dispatch_timeout_ms / 1000
+        # None is the shutdown sentinel
+        self._requests: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, query_embeddings, n_results: int, where: Optional[Dict[str, Any]] = None) -> Future:
+        """Queue a query; the future resolves to a ChromaDB-style result for its embeddings."""
+        request = _Request(query_embeddings, n_results, where)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("BatchedQueryDispatcher is closed")
+            self._ensure_worker()
+            self._requests.put(request)
+        return request.future
+
+    def query(self, query_embeddings, n_results: int, where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run a query through the dispatcher and wait for its result."""
+        return self.submit(query_embeddings, n_results, where).result()
+
+    def close(self) -> None:
+        """Stop the dispatch thread once already queued requests are served; later submits raise."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._worker is not None:
+                self._requests.put(None)
+
+    def _ensure_worker(self) -> None:
+        """Start the dispatch thread on first use (called with the lock held)."""
+        if self._worker is None:
+            self._worker = threading.Thread(
+                target=self._run, name="BatchedQueryDispatcher", daemon=True
+            )
+            self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            first = self._requests.get()
+            if first is None:
+                return
+            batch = [first]
+            closing = False
+            # Only wait for more requests if others are already queued behind this one
+            deadline = time.monotonic() + self.dispatch_timeout if not self._requests.empty() else 0
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    request = self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                batch.append(request)
+
+            # Only queries with the same filter can share a call
+            groups: Dict[str, List[_Request]] = {}
+            for request in batch:
+                groups.setdefault(json.dumps(request.where, sort_keys=True, default=str), []).append(request)
+            for requests in groups.values():
+                self._dispatch(requests)
+            if closing:
+                return
+
+    def _dispatch(self, requests: List[_Request]) -> None:
+        """Run one query call for requests sharing a filter and fan the rows back out."""
+        try:
+            results = self.query_fn(
+                query_embeddings=[emb for request in requests for emb in request.query_embeddings],
+                n_results=max(request.n_results for request in requests),
+                where=requests[0].where,
+            )
+            offset = 0
+            for request in requests:
+                rows = slice(offset, offset + len(request.query_embeddings))
+                offset = rows.stop
+                request.future.set_result({
+                    # Per-query fields are lists with one row per query embedding
+                    key: [row[:request.n_results] for row in value[rows]] if isinstance(value, list) and key != "included" else value
+                    for key, value in results.items()
+                })
+        except Exception as e:
+            # Fail every caller not yet answered, so no future is left pending
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
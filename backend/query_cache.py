@@ -0,0 +1,87 @@
+"""
+In-memory LRU cache with TTL for vector store query results.
+
+Retrieval results are deterministic for a given (query, k, filter, model) as long as
+the collection does not change, and a small set of queries makes up most traffic,
+so repeated queries can skip embedding and index traversal entirely.
+"""
+
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+DEFAULT_MAX_SIZE = 1000
+DEFAULT_TTL = 300  # seconds
+
+
+class QueryCache:
+    """Thread-safe LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, ttl: float = DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        # Bumped by clear(); a result computed before a clear must not be stored after it
+        self._generation = 0
+
+    @staticmethod
+    def make_key(method: str, query: str, k: int, where: Optional[Dict[str, Any]] = None, *extra) -> Hashable:
+        """Build a cache key; the filter is serialized so equal dicts map to the same key."""
+        return (method, query, k, json.dumps(where, sort_keys=True, default=str), *extra)
+
+    @property
+    def generation(self) -> int:
+        """Current generation; read it before computing a value to pass to put()."""
+        with self._lock:
+            return self._generation
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a copy of the cached value, or None on a miss or expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        """
+        Store a copy of value, evicting the least recently used entry when full.
+        
+        If `generation` is given and clear() has run since it was read, the value
+        may predate the change that triggered the clear, so it is not stored.
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic(), copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all entries (call whenever the underlying collection changes)."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+            }
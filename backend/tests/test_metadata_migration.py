@@ -5,7 +5,13 @@ Tests MetadataMigration class from metadata_migration.py
 
 import pytest
 from unittest.mock import Mock, MagicMock, call
-from backend.metadata_migration import MetadataMigration
+from backend.metadata_migration import (
+    MetadataMigration,
+    MigrationProgress,
+    ItemMetadata,
+    cap_delimited_values,
+    parse_year,
+)
 
 
 class TestMetadataMigration:
@@ -269,6 +275,131 @@ class TestMigrationCaching:
         assert '1' in cache
 
 
+class TestBatchItemFields:
+    """Test item-level fields are built once per item within a batch."""
+    
+    def test_chunks_of_same_item_share_item_fields(self):
+        """Test each chunk gets the item fields plus its own chunk fields."""
+        mock_chroma = Mock()
+        migration = MetadataMigration(mock_chroma, Mock())
+        cache = {'1': ItemMetadata(title='P1', authors='A', tags='NLP', year=None, item_type='book')}
+        metadatas = [
+            {'item_id': '1', 'year': '2020', 'chunk_idx': i, 'page': i + 1, 'pdf_path': '/p1.pdf'}
+            for i in range(3)
+        ]
+        
+        with pytest.MonkeyPatch.context() as mp:
+            build = Mock(wraps=MetadataMigration._build_item_fields)
+            mp.setattr(MetadataMigration, '_build_item_fields', build)
+            migration._migrate_batch(['1:0', '1:1', '1:2'], metadatas, cache)
+        
+        assert build.call_count == 1
+        written = mock_chroma.collection.update.call_args.kwargs['metadatas']
+        assert [m['chunk_idx'] for m in written] == [0, 1, 2]
+        assert [m['page'] for m in written] == [1, 2, 3]
+        assert all(m['item_id'] == 1 and m['year'] == -1 and m['title'] == 'P1' for m in written)
+
+
+class TestItemMetadata:
+    """Test building cached item metadata from Zotero items."""
+    
+    def test_parse_year(self):
+        """Test year parsing in different formats."""
+        assert parse_year('2021-03-10') == 2021
+        assert parse_year('2022') == 2022
+        assert parse_year('March 1999') == 1999
+        assert parse_year('unknown') is None
+        assert parse_year(None) is None
+    
+    def test_from_zotero_item(self):
+        """Test fields are copied and the year parsed to an integer."""
+        meta = ItemMetadata.from_zotero_item({
+            'item_id': '1',
+            'title': 'Paper with "quotes"',
+            'authors': "O'Brien",
+            'tags': 'C++,C#',
+            'collections': None,
+            'date': '2020-01-15',
+            'item_type': 'journalArticle',
+        })
+        
+        assert meta.title == 'Paper with "quotes"'
+        assert meta.authors == "O'Brien"
+        assert meta.tags == 'C++,C#'
+        assert meta.collections == ''
+        assert meta.year == 2020
+        assert meta.item_type == 'journalArticle'
+
+
+class TestMigrationProgress:
+    """Test the MigrationProgress counters."""
+    
+    def test_dict_style_access(self):
+        """Test progress supports dict-style reads and writes."""
+        progress = MigrationProgress()
+        progress['failed_chunks'] = 5
+        
+        assert progress.failed_chunks == 5
+        assert progress['failed_chunks'] == 5
+        assert progress['items_processed'] == set()
+    
+    def test_unknown_key_raises(self):
+        """Test unknown keys raise KeyError like a dict."""
+        progress = MigrationProgress()
+        
+        with pytest.raises(KeyError):
+            progress['unknown']
+        with pytest.raises(KeyError):
+            progress['unknown'] = 1
+
+
+class TestMetadataCaps:
+    """Test capping of list-valued metadata before it is written to ChromaDB."""
+    
+    def test_cap_under_limit_unchanged(self):
+        """Test values at or under the limit are returned as-is."""
+        assert cap_delimited_values("NLP,ML,CV", 3) == "NLP,ML,CV"
+        assert cap_delimited_values("NLP", 1) == "NLP"
+    
+    def test_cap_empty_values(self):
+        """Test None and empty strings become empty strings."""
+        assert cap_delimited_values(None, 5) == ""
+        assert cap_delimited_values("", 5) == ""
+    
+    def test_cap_keep_first(self):
+        """Test KEEP strategy keeps the first N values."""
+        assert cap_delimited_values("a,b,c,d", 2, method="KEEP") == "a,b"
+    
+    def test_cap_fifo_keeps_last(self):
+        """Test FIFO strategy keeps the last N values."""
+        assert cap_delimited_values("a,b,c,d", 2, method="FIFO") == "c,d"
+    
+    def test_cap_disabled(self):
+        """Test a non-positive limit disables capping."""
+        assert cap_delimited_values("a,b,c", 0) == "a,b,c"
+    
+    def test_migration_caps_tags(self):
+        """Test migration writes capped tags to ChromaDB."""
+        mock_chroma = Mock()
+        mock_chroma.collection.get.return_value = {
+            'ids': ['1:0'],
+            'metadatas': [{'item_id': '1', 'year': '2020', 'tags': ''}]
+        }
+        mock_zotero = Mock()
+        mock_zotero.search_parent_items_with_pdfs.return_value = [{
+            'item_id': '1',
+            'date': '2020',
+            'tags': ','.join(f'tag{i}' for i in range(500)),
+        }]
+        
+        migration = MetadataMigration(mock_chroma, mock_zotero)
+        migration.migrate_all_metadata()
+        
+        written = mock_chroma.collection.update.call_args.kwargs['metadatas'][0]
+        assert len(written['tags'].split(',')) == 100
+        assert written['tags'].startswith('tag0,')
+
+
 class TestMigrationSummary:
     """Test migration summary generation."""
     
@@ -249,9 +249,31 @@ class TestMergeWhereClauses:
         result = merge_where_clauses(clause1, clause2)
         
         expected = {
-            "$and": [clause1, clause2]
+            "$and": [
+                {"year": {"$gte": 2018}},
+                {"year": {"$lte": 2022}},
+                clause2
+            ]
         }
         assert result == expected
+    
+    def test_merge_flattens_and(self):
+        """Test merging two $and clauses produces one flat $and."""
+        clause1 = {"$and": [{"item_id": {"$in": [1, 2]}}, {"year": {"$gte": 2018}}]}
+        clause2 = {"$and": [{"year": {"$lte": 2022}}, {"tags": {"$contains": "NLP"}}]}
+        result = merge_where_clauses(clause1, clause2)
+        
+        assert result == {
+            "$and": [
+                {"item_id": {"$in": [1, 2]}},
+                {"year": {"$gte": 2018}},
+                {"year": {"$lte": 2022}},
+                {"tags": {"$contains": "NLP"}}
+            ]
+        }
+        # Inputs are left untouched
+        assert len(clause1["$and"]) == 2
+        assert len(clause2["$and"]) == 2
 
 
 class TestFormatFiltersForDisplay:
@@ -362,7 +384,33 @@ class TestEdgeCases:
         assert where is not None
         assert "$or" in where
         assert len(where["$or"]) == 100
-    
+
+    def test_repeated_filters_are_cached(self):
+        """Test identical filter combinations reuse the cached clause."""
+        tags = ["NLP", "ML"]
+        first = build_metadata_where_clause(year_min=2020, tags=tags)
+
+        # Mutating the caller's list must not affect the cached clause
+        tags.append("CV")
+        second = build_metadata_where_clause(year_min=2020, tags=["NLP", "ML"])
+
+        assert second == first
+        assert len(second["$and"][1]["$or"]) == 2
+
+    def test_cached_clause_is_not_shared(self):
+        """Test modifying a returned clause does not corrupt later results."""
+        first = build_metadata_where_clause(year_min=2020, tags=["NLP", "ML"])
+        first["$and"].append({"item_type": {"$eq": "book"}})
+        first["$and"][1]["$or"].clear()
+
+        second = build_metadata_where_clause(year_min=2020, tags=["NLP", "ML"])
+
+        assert second is not first
+        assert second == {"$and": [
+            {"year": {"$gte": 2020}},
+            {"$or": [{"tags": {"$contains": "NLP"}}, {"tags": {"$contains": "ML"}}]},
+        ]}
+
     def test_validation_deeply_nested(self):
         """Test validation of deeply nested conditions."""
         where = {
@@ -383,6 +431,16 @@ class TestEdgeCases:
         }
         assert validate_where_clause(where) == True
 
+    def test_validation_beyond_recursion_limit(self):
+        """Test validation does not recurse per nesting level."""
+        where = {"field": {"$eq": 1}}
+        for _ in range(5000):
+            where = {"$and": [where]}
+        assert validate_where_clause(where) == True
+
+        where["$and"].append("not a dict")
+        assert validate_where_clause(where) == False
+
 
 class TestRealWorldScenarios:
     """Test real-world usage scenarios."""
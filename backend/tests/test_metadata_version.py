@@ -3,124 +3,136 @@ Unit tests for metadata version detection.
 Tests MetadataVersionManager class from metadata_version.py
 """
 
+import math
 import pytest
-from unittest.mock import Mock, MagicMock
-from backend.metadata_version import MetadataVersionManager, check_metadata_compatibility
+from dataclasses import dataclass, field
+from typing import List, Optional
+from unittest.mock import Mock
+from backend.metadata_version import (
+    MetadataVersionManager,
+    check_metadata_compatibility,
+    invalidate_metadata_version_cache,
+)
+
+
+# Pre-built collection.get() responses shared by the fake ChromaDB clients
+EMPTY_RESULT = {
+    'ids': [],
+    'metadatas': [],
+    'documents': []
+}
+
+V1_RESULT = {
+    'ids': ['1:0', '2:0', '3:0', '4:0', '5:0'],
+    'metadatas': [
+        {'item_id': '1', 'year': '2020', 'title': 'Paper 1'},
+        {'item_id': '2', 'year': '2019', 'title': 'Paper 2'},
+        {'item_id': '3', 'year': '2021', 'title': 'Paper 3'},
+        {'item_id': '4', 'year': '2018', 'title': 'Paper 4'},
+        {'item_id': '5', 'year': '', 'title': 'Paper 5'},
+    ]
+}
+
+V2_RESULT = {
+    'ids': ['1:0', '2:0', '3:0', '4:0', '5:0'],
+    'metadatas': [
+        {'item_id': '1', 'year': 2020, 'tags': 'NLP|ML', 'collections': 'Research', 'title': 'Paper 1'},
+        {'item_id': '2', 'year': 2019, 'tags': 'CV', 'collections': '', 'title': 'Paper 2'},
+        {'item_id': '3', 'year': 2021, 'tags': '', 'collections': 'PhD', 'title': 'Paper 3'},
+        {'item_id': '4', 'year': 2018, 'tags': 'NLP', 'collections': 'Research|Survey', 'title': 'Paper 4'},
+        {'item_id': '5', 'year': None, 'tags': '', 'collections': '', 'title': 'Paper 5'},
+    ]
+}
+
+MIXED_RESULT = {
+    'ids': ['1:0', '2:0', '3:0', '4:0', '5:0'],
+    'metadatas': [
+        {'item_id': '1', 'year': 2020, 'tags': 'NLP', 'collections': '', 'title': 'Paper 1'},  # v2
+        {'item_id': '2', 'year': '2019', 'title': 'Paper 2'},  # v1
+        {'item_id': '3', 'year': 2021, 'tags': 'ML', 'collections': 'Research', 'title': 'Paper 3'},  # v2
+        {'item_id': '4', 'year': '2018', 'title': 'Paper 4'},  # v1
+        {'item_id': '5', 'year': 2022, 'tags': '', 'collections': '', 'title': 'Paper 5'},  # v2
+    ]
+}
+
+
+@dataclass(slots=True)
+class FakeCollection:
+    """Minimal stand-in for a ChromaDB collection that records get() calls (raises error if given)."""
+    count_val: int
+    get_val: dict
+    calls: List[dict] = field(default_factory=list)
+    error: Optional[Exception] = None
+    
+    def count(self) -> int:
+        if self.error:
+            raise self.error
+        return self.count_val
+    
+    def get(self, limit=None, offset=0, **kwargs) -> dict:
+        self.calls.append({'limit': limit, 'offset': offset, **kwargs})
+        if self.error:
+            raise self.error
+        end = None if limit is None else offset + limit
+        return {key: values[offset:end] for key, values in self.get_val.items()}
+
+
+@dataclass(slots=True, weakref_slot=True, eq=False)
+class FakeChroma:
+    """Minimal stand-in for ChromaClient exposing only .collection (hashed by identity)."""
+    collection: FakeCollection
+
+
+def make_fake_chroma(count: int, result: dict, error: Optional[Exception] = None) -> FakeChroma:
+    """Build a fake ChromaDB client whose collection pages through result (or raises error)."""
+    return FakeChroma(FakeCollection(count, result, error=error))
 
 
 class TestMetadataVersionManager:
     """Test suite for MetadataVersionManager."""
     
-    @pytest.fixture
-    def mock_chroma_empty(self):
-        """Mock ChromaDB client with empty collection."""
-        mock = Mock()
-        mock.collection.count.return_value = 0
-        mock.collection.get.return_value = {
-            'ids': [],
-            'metadatas': [],
-            'documents': []
-        }
-        return mock
-    
-    @pytest.fixture
+    # MetadataVersionManager caches per manager, so a client only used through fresh
+    # managers can be shared across the session. check_metadata_compatibility() caches
+    # per client in module state, so its tests build their own clients.
+    @pytest.fixture(scope="session")
     def mock_chroma_v1(self):
-        """Mock ChromaDB client with v1 metadata (string year)."""
-        mock = Mock()
-        mock.collection.count.return_value = 100
-        mock.collection.get.return_value = {
-            'ids': ['1:0', '2:0', '3:0', '4:0', '5:0'],
-            'metadatas': [
-                {'item_id': '1', 'year': '2020', 'title': 'Paper 1'},
-                {'item_id': '2', 'year': '2019', 'title': 'Paper 2'},
-                {'item_id': '3', 'year': '2021', 'title': 'Paper 3'},
-                {'item_id': '4', 'year': '2018', 'title': 'Paper 4'},
-                {'item_id': '5', 'year': '', 'title': 'Paper 5'},
-            ]
-        }
-        return mock
-    
-    @pytest.fixture
-    def mock_chroma_v2(self):
-        """Mock ChromaDB client with v2 metadata (integer year + tags + collections)."""
-        mock = Mock()
-        mock.collection.count.return_value = 100
-        mock.collection.get.return_value = {
-            'ids': ['1:0', '2:0', '3:0', '4:0', '5:0'],
-            'metadatas': [
-                {'item_id': '1', 'year': 2020, 'tags': 'NLP|ML', 'collections': 'Research', 'title': 'Paper 1'},
-                {'item_id': '2', 'year': 2019, 'tags': 'CV', 'collections': '', 'title': 'Paper 2'},
-                {'item_id': '3', 'year': 2021, 'tags': '', 'collections': 'PhD', 'title': 'Paper 3'},
-                {'item_id': '4', 'year': 2018, 'tags': 'NLP', 'collections': 'Research|Survey', 'title': 'Paper 4'},
-                {'item_id': '5', 'year': None, 'tags': '', 'collections': '', 'title': 'Paper 5'},
-            ]
-        }
-        return mock
+        """ChromaDB client with v1 metadata (string year)."""
+        return make_fake_chroma(100, V1_RESULT)
     
     @pytest.fixture
-    def mock_chroma_mixed(self):
-        """Mock ChromaDB client with mixed v1/v2 metadata."""
-        mock = Mock()
-        mock.collection.count.return_value = 100
-        mock.collection.get.return_value = {
-            'ids': ['1:0', '2:0', '3:0', '4:0', '5:0'],
-            'metadatas': [
-                {'item_id': '1', 'year': 2020, 'tags': 'NLP', 'collections': '', 'title': 'Paper 1'},  # v2
-                {'item_id': '2', 'year': '2019', 'title': 'Paper 2'},  # v1
-                {'item_id': '3', 'year': 2021, 'tags': 'ML', 'collections': 'Research', 'title': 'Paper 3'},  # v2
-                {'item_id': '4', 'year': '2018', 'title': 'Paper 4'},  # v1
-                {'item_id': '5', 'year': 2022, 'tags': '', 'collections': '', 'title': 'Paper 5'},  # v2
-            ]
-        }
-        return mock
-    
-    def test_detect_version_empty(self, mock_chroma_empty):
-        """Test version detection on empty database."""
-        manager = MetadataVersionManager(mock_chroma_empty)
-        version = manager.detect_metadata_version()
-        assert version == 0
-    
-    def test_detect_version_v1(self, mock_chroma_v1):
-        """Test version detection on v1 database (string year)."""
-        manager = MetadataVersionManager(mock_chroma_v1)
-        version = manager.detect_metadata_version()
-        assert version == 1
-    
-    def test_detect_version_v2(self, mock_chroma_v2):
-        """Test version detection on v2 database (integer year)."""
-        manager = MetadataVersionManager(mock_chroma_v2)
-        version = manager.detect_metadata_version()
-        assert version == 2
-    
-    def test_detect_version_mixed(self, mock_chroma_mixed):
-        """Test version detection on mixed database (majority wins)."""
-        manager = MetadataVersionManager(mock_chroma_mixed)
-        version = manager.detect_metadata_version()
-        # 3 v2 chunks vs 2 v1 chunks, should return v2
-        assert version == 2
+    def recording_chroma_v2(self):
+        """Fresh ChromaDB client with v2 metadata, for tests that inspect calls."""
+        return make_fake_chroma(100, V2_RESULT)
     
-    def test_is_migration_needed_empty(self, mock_chroma_empty):
-        """Test migration check on empty database."""
-        manager = MetadataVersionManager(mock_chroma_empty)
-        # Empty database (version 0) technically needs migration to version 2
-        assert manager.is_migration_needed() == True
+    @pytest.mark.parametrize("count,result,expected_version", [
+        (0, EMPTY_RESULT, 0),     # empty database
+        (100, V1_RESULT, 1),      # string year
+        (100, V2_RESULT, 2),      # integer year
+        (100, MIXED_RESULT, 2),   # 3 v2 chunks vs 2 v1 chunks, majority wins
+    ], ids=["empty", "v1", "v2", "mixed"])
+    def test_detect_version(self, count, result, expected_version):
+        """Test version detection on empty, v1, v2 and mixed databases."""
+        manager = MetadataVersionManager(make_fake_chroma(count, result))
+        assert manager.detect_metadata_version() == expected_version
     
-    def test_is_migration_needed_v1(self, mock_chroma_v1):
-        """Test migration check on v1 database."""
-        manager = MetadataVersionManager(mock_chroma_v1)
-        assert manager.is_migration_needed() == True
-    
-    def test_is_migration_needed_v2(self, mock_chroma_v2):
-        """Test migration check on v2 database."""
-        manager = MetadataVersionManager(mock_chroma_v2)
-        assert manager.is_migration_needed() == False
+    @pytest.mark.parametrize("count,result,expected", [
+        (0, EMPTY_RESULT, True),  # version 0 technically needs migration to version 2
+        (100, V1_RESULT, True),
+        (100, V2_RESULT, False),
+    ], ids=["empty", "v1", "v2"])
+    def test_is_migration_needed(self, count, result, expected):
+        """Test migration check per database version."""
+        manager = MetadataVersionManager(make_fake_chroma(count, result))
+        assert manager.is_migration_needed() == expected
     
-    def test_get_migration_message_v0(self, mock_chroma_empty):
-        """Test migration message for empty database."""
-        manager = MetadataVersionManager(mock_chroma_empty)
-        message = manager.get_migration_message()
-        # Empty database should return None
-        assert message is None
+    @pytest.mark.parametrize("count,result", [
+        (0, EMPTY_RESULT),
+        (100, V2_RESULT),
+    ], ids=["v0", "v2"])
+    def test_get_migration_message_none(self, count, result):
+        """Test empty and up-to-date databases have no migration message."""
+        manager = MetadataVersionManager(make_fake_chroma(count, result))
+        assert manager.get_migration_message() is None
     
     def test_get_migration_message_v1(self, mock_chroma_v1):
         """Test migration message for v1 database."""
@@ -131,56 +143,73 @@ class TestMetadataVersionManager:
         assert "metadata" in message.lower()
         assert "filtering" in message.lower()
     
-    def test_get_migration_message_v2(self, mock_chroma_v2):
-        """Test migration message for v2 database."""
-        manager = MetadataVersionManager(mock_chroma_v2)
-        message = manager.get_migration_message()
-        # v2 should return None (already up to date)
-        assert message is None
-    
-    def test_version_caching(self, mock_chroma_v2):
+    def test_version_caching(self, recording_chroma_v2):
         """Test that version is cached after first detection."""
-        manager = MetadataVersionManager(mock_chroma_v2)
+        manager = MetadataVersionManager(recording_chroma_v2)
         
         # First call
         version1 = manager.detect_metadata_version()
+        calls = len(recording_chroma_v2.collection.calls)
         
         # Second call should use cache
         version2 = manager.detect_metadata_version()
         
         assert version1 == version2
-        # get should only be called once due to caching
-        assert mock_chroma_v2.collection.get.call_count == 1
+        # get should not be called again due to caching
+        assert len(recording_chroma_v2.collection.calls) == calls
     
-    def test_check_metadata_compatibility_v1(self, mock_chroma_v1):
+    def test_check_metadata_compatibility_v1(self):
         """Test compatibility check function for v1."""
-        result = check_metadata_compatibility(mock_chroma_v1, enable_filtering=True)
+        result = check_metadata_compatibility(make_fake_chroma(100, V1_RESULT), enable_filtering=True)
         
         # v1 format should return False (not compatible with filtering)
         assert result == False
     
-    def test_check_metadata_compatibility_v2(self, mock_chroma_v2):
+    def test_check_metadata_compatibility_v2(self):
         """Test compatibility check function for v2."""
-        result = check_metadata_compatibility(mock_chroma_v2, enable_filtering=True)
+        result = check_metadata_compatibility(make_fake_chroma(100, V2_RESULT), enable_filtering=True)
         
         # v2 format should return True (compatible with filtering)
         assert result == True
     
-    def test_sample_size_limit(self, mock_chroma_v2):
-        """Test that sample size is limited to 10 chunks."""
-        manager = MetadataVersionManager(mock_chroma_v2)
-        manager.detect_metadata_version()
+    def test_check_metadata_compatibility_cached(self, recording_chroma_v2):
+        """Test repeated compatibility checks detect the version once per client."""
+        calls = recording_chroma_v2.collection.calls
+        assert check_metadata_compatibility(recording_chroma_v2, True) == True
+        detection_calls = len(calls)
+        assert check_metadata_compatibility(recording_chroma_v2, True) == True
+        assert len(calls) == detection_calls
         
-        # Verify get was called with limit=10
-        mock_chroma_v2.collection.get.assert_called_once()
-        call_kwargs = mock_chroma_v2.collection.get.call_args[1]
-        assert call_kwargs.get('limit') == 10
+        # Invalidating (e.g. after a migration) forces re-detection
+        invalidate_metadata_version_cache(recording_chroma_v2)
+        check_metadata_compatibility(recording_chroma_v2, True)
+        assert len(calls) == 2 * detection_calls
+    
+    def test_check_metadata_compatibility_empty_not_cached(self):
+        """Test an empty database is re-checked on the next call."""
+        fake = make_fake_chroma(0, EMPTY_RESULT)
+        
+        assert check_metadata_compatibility(fake, True) == False
+        assert check_metadata_compatibility(fake, True) == False
+        assert len(fake.collection.calls) == 2
+    
+    def test_sample_size_limit(self):
+        """Test that sampling reads at most 10 chunks in a single get call."""
+        fake = make_fake_chroma(100, MIXED_RESULT | {
+            'ids': [f'{i}:0' for i in range(20)],
+            'metadatas': MIXED_RESULT['metadatas'] * 4,
+        })
+        MetadataVersionManager(fake).detect_metadata_version()
+        
+        calls = fake.collection.calls
+        assert len(calls) == 1
+        assert calls[0]['limit'] == 10
+        # Detection reads only metadata, never document text
+        assert calls[0]['include'] == ['metadatas']
     
     def test_version_voting_logic(self):
         """Test version voting with custom metadata."""
-        mock = Mock()
-        mock.collection.count.return_value = 100
-        mock.collection.get.return_value = {
+        fake = make_fake_chroma(100, {
             'ids': ['1:0', '2:0', '3:0', '4:0', '5:0', '6:0', '7:0'],
             'metadatas': [
                 {'year': 2020, 'tags': 'A'},  # v2
@@ -191,54 +220,109 @@ class TestMetadataVersionManager:
                 {'year': '2020'},              # v1
                 {'year': 2020, 'tags': 'C'},  # v2
             ]
-        }
+        })
         
-        manager = MetadataVersionManager(mock)
+        manager = MetadataVersionManager(fake)
         version = manager.detect_metadata_version()
         
         # 4 v1 vs 3 v2, should return v1
         assert version == 1
+    
+    @pytest.mark.parametrize("n_v1,n_v2,expected", [
+        (6_000, 4_000, 1),
+        (4_000, 6_000, 2),
+        (5_000, 5_000, 1),  # ties go to the legacy format
+        (0, 10_000, 2),
+    ])
+    def test_large_sample_majority(self, n_v1, n_v2, expected):
+        """Test majority voting over a large configured sample."""
+        metadatas = [{'year': '2020'}] * n_v1 + [{'year': 2020, 'tags': '', 'collections': ''}] * n_v2
+        fake = make_fake_chroma(100_000, {'ids': [''] * len(metadatas), 'metadatas': metadatas})
+        
+        manager = MetadataVersionManager(fake, sample_size=10_000)
+        
+        assert manager.detect_metadata_version() == expected
+        assert len(fake.collection.calls) == 1
 
 
-class TestEdgeCases:
-    """Test edge cases and error handling."""
+class TestMigrateV1ToV2:
+    """Test the in-place metadata format upgrade."""
     
-    def test_malformed_metadata(self):
-        """Test handling of malformed metadata."""
+    def test_updates_use_client_max_batch_size(self):
+        """Test 10,000 legacy chunks are updated in max-batch-size sized calls."""
+        mock = Mock()
+        mock.chroma_client.get_max_batch_size.return_value = 4096
+        mock.iter_collection_pages.return_value = iter([{
+            'ids': [f"{i}:0" for i in range(10_000)],
+            'metadatas': [{'item_id': str(i), 'year': '2020'} for i in range(10_000)],
+        }])
+        
+        updated = MetadataVersionManager(mock).migrate_v1_to_v2()
+        
+        assert updated == 10_000
+        assert mock.collection.update.call_count == math.ceil(10_000 / 4096)
+        batch_sizes = [len(call.kwargs['ids']) for call in mock.collection.update.call_args_list]
+        assert batch_sizes == [4096, 4096, 1808]
+    
+    def test_reads_page_by_page(self):
+        """Test metadata is read through the client's pager and each page updated on its own."""
+        mock = Mock()
+        mock.chroma_client.get_max_batch_size.return_value = 4096
+        mock.iter_collection_pages.return_value = iter([
+            {'ids': [f"{i}:0" for i in range(start, start + 3)],
+             'metadatas': [{'year': '2020'}] * 3}
+            for start in (0, 3)
+        ])
+        
+        assert MetadataVersionManager(mock).migrate_v1_to_v2() == 6
+        
+        mock.iter_collection_pages.assert_called_once_with(include=['metadatas'])
+        mock.collection.get.assert_not_called()
+        assert [call.kwargs['ids'] for call in mock.collection.update.call_args_list] == [
+            ['0:0', '1:0', '2:0'], ['3:0', '4:0', '5:0']
+        ]
+    
+    def test_converts_legacy_fields(self):
+        """Test year strings become ints and missing list fields are added."""
         mock = Mock()
-        mock.collection.count.return_value = 10
-        mock.collection.get.return_value = {
-            'ids': ['1:0', '2:0'],
+        mock.iter_collection_pages.return_value = iter([{
+            'ids': ['1:0', '2:0', '3:0'],
             'metadatas': [
-                {'item_id': '1'},  # Missing year
-                None,              # Null metadata
-            ]
-        }
+                {'year': '2020-05-01', 'title': 'A'},
+                {'year': '', 'title': 'B'},
+                {'year': 2021, 'tags': 'NLP', 'collections': '', 'title': 'C'},  # already v2
+            ],
+        }])
+        
+        assert MetadataVersionManager(mock).migrate_v1_to_v2(batch_size=100) == 2
         
-        manager = MetadataVersionManager(mock)
+        mock.collection.update.assert_called_once_with(
+            ids=['1:0', '2:0'],
+            metadatas=[
+                {'year': 2020, 'title': 'A', 'tags': '', 'collections': ''},
+                {'year': -1, 'title': 'B', 'tags': '', 'collections': ''},
+            ],
+        )
+        mock.chroma_client.get_max_batch_size.assert_not_called()
+
+
+class TestEdgeCases:
+    """Test edge cases and error handling."""
+    
+    def test_malformed_metadata(self):
+        """Test handling of malformed metadata (missing year, null metadata)."""
+        manager = MetadataVersionManager(make_fake_chroma(10, {'ids': ['1:0', '2:0'], 'metadatas': [{'item_id': '1'}, None]}))
         # Should not crash, should default to v0 or v1
-        version = manager.detect_metadata_version()
-        assert version in [0, 1, 2]
+        assert manager.detect_metadata_version() in [0, 1, 2]
     
     def test_empty_get_response(self):
         """Test handling of empty get response."""
-        mock = Mock()
-        mock.collection.count.return_value = 100
-        mock.collection.get.return_value = {
-            'ids': [],
-            'metadatas': []
-        }
-        
-        manager = MetadataVersionManager(mock)
-        version = manager.detect_metadata_version()
-        assert version == 0  # Should treat as empty
+        manager = MetadataVersionManager(make_fake_chroma(100, EMPTY_RESULT))
+        assert manager.detect_metadata_version() == 0  # Should treat as empty
     
     def test_chroma_error_handling(self):
         """Test handling of ChromaDB errors."""
-        mock = Mock()
-        mock.collection.count.side_effect = Exception("ChromaDB error")
-        
-        manager = MetadataVersionManager(mock)
+        manager = MetadataVersionManager(make_fake_chroma(100, V2_RESULT, error=Exception("ChromaDB error")))
         # Should handle error gracefully
         try:
             version = manager.detect_metadata_version()
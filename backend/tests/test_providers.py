@@ -6,8 +6,10 @@ Tests that all providers handle the same queries consistently and pass validatio
 
 import pytest
 from backend.model_providers.base import (
+    BaseProvider,
     Message, 
     ChatResponse,
+    ModelInfo,
     ResponseValidator,
     MessageAdapter,
     ParameterMapper
@@ -63,70 +65,90 @@ class TestMessageAdapter:
         assert history[0]["role"] == "user"
         assert history[1]["role"] == "model"  # Not 'assistant'
         assert "parts" in history[0]
-
-
-class TestParameterMapper:
-    """Test ParameterMapper translates parameters correctly."""
-    
-    def test_ollama_params(self):
-        """Test Ollama parameter mapping."""
-        params = {
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "top_k": 50,
-            "repetition_penalty": 1.1
-        }
-        
-        mapped = ParameterMapper.map_params(params, "ollama")
-        
-        assert "temperature" in mapped
-        assert "top_p" in mapped
-        assert "top_k" in mapped
-        assert "repeat_penalty" in mapped  # Maps from repetition_penalty to repeat_penalty
-        assert mapped["repeat_penalty"] == 1.1
     
-    def test_openai_params(self):
-        """Test OpenAI parameter mapping."""
-        params = {
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "repetition_penalty": 1.1
-        }
+    def test_to_gemini_large_history(self):
+        """Test Gemini conversion of a long alternating chat history."""
+        messages = [Message(role="system", content="You are helpful.")]
+        messages += [
+            Message(role="user" if i % 2 == 0 else "assistant", content=f"turn {i}")
+            for i in range(10_000)
+        ]
         
-        mapped = ParameterMapper.map_params(params, "openai")
+        system_inst, history = MessageAdapter.to_gemini(messages)
         
-        assert "temperature" in mapped
-        assert "top_p" in mapped
-        assert "frequency_penalty" in mapped  # Mapped from repetition_penalty
-        assert "top_k" not in mapped  # OpenAI doesn't support top_k
+        assert system_inst == "You are helpful."
+        assert len(history) == 10_000
+        assert [h["role"] for h in history[:4]] == ["user", "model", "user", "model"]
+        assert history[-1] == {"role": "model", "parts": ["turn 9999"]}
     
-    def test_anthropic_params(self):
-        """Test Anthropic parameter mapping."""
-        params = {
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "top_k": 50,
-            "repetition_penalty": 1.1
-        }
+    def test_last_system_message_wins(self):
+        """Test the last system message is used when several are present."""
+        messages = [
+            Message(role="system", content="First"),
+            Message(role="user", content="Hello"),
+            Message(role="system", content="Second")
+        ]
         
-        mapped = ParameterMapper.map_params(params, "anthropic")
+        system, conversation = MessageAdapter.to_anthropic(messages)
+        system_inst, history = MessageAdapter.to_gemini(messages)
+        
+        assert system == system_inst == "Second"
+        assert len(conversation) == len(history) == 1
+
+
+class TestMessageTypes:
+    """Test the standard message/response types stay lightweight."""
+    
+    def test_message_is_slotted(self):
+        """Test Message instances have no per-instance __dict__."""
+        assert not hasattr(Message(role="user", content="x"), "__dict__")
+        assert not hasattr(ChatResponse(content="x", model="m"), "__dict__")
+    
+    def test_message_is_frozen_and_hashable(self):
+        """Test Message is immutable and can be used as a cache key."""
+        message = Message(role="user", content="x")
         
-        assert "temperature" in mapped
-        assert "top_p" in mapped
-        assert "top_k" in mapped
-        assert "repetition_penalty" not in mapped  # Not supported
+        with pytest.raises(AttributeError):
+            message.content = "y"
+        assert {message: 1}[Message(role="user", content="x")] == 1
+
+
+class TestParameterMapper:
+    """Test ParameterMapper translates parameters correctly."""
+    
+    SAMPLING_PARAMS = {
+        "temperature": 0.7,
+        "top_p": 0.9,
+        "top_k": 50,
+        "repetition_penalty": 1.1
+    }
     
-    def test_unmapped_params_preserved(self):
-        """Test that unmapped parameters are preserved."""
-        params = {
-            "temperature": 0.7,
-            "custom_param": "value"
-        }
+    @pytest.mark.parametrize("provider_id,params,must_have,must_not_have", [
+        # Ollama maps repetition_penalty to repeat_penalty
+        ("ollama", SAMPLING_PARAMS,
+         {"temperature", "top_p", "top_k", "repeat_penalty"}, {"repetition_penalty"}),
+        # OpenAI maps repetition_penalty to frequency_penalty and doesn't support top_k
+        ("openai", SAMPLING_PARAMS,
+         {"temperature", "top_p", "frequency_penalty"}, {"top_k", "repetition_penalty"}),
+        # Anthropic doesn't support repetition_penalty
+        ("anthropic", SAMPLING_PARAMS,
+         {"temperature", "top_p", "top_k"}, {"repetition_penalty"}),
+        # Unmapped parameters are preserved
+        ("openai", {"temperature": 0.7, "custom_param": "value"},
+         {"temperature", "custom_param"}, set()),
+    ], ids=["ollama", "openai", "anthropic", "unmapped_preserved"])
+    def test_map_params(self, provider_id, params, must_have, must_not_have):
+        """Test parameter mapping per provider."""
+        mapped = ParameterMapper.map_params(params, provider_id)
         
-        mapped = ParameterMapper.map_params(params, "openai")
+        assert must_have <= mapped.keys()
+        assert not (must_not_have & mapped.keys())
+    
+    def test_mapped_values_carried_over(self):
+        """Test renamed parameters keep their values."""
+        mapped = ParameterMapper.map_params(self.SAMPLING_PARAMS, "ollama")
         
-        assert "temperature" in mapped
-        assert "custom_param" in mapped  # Should be preserved
+        assert mapped["repeat_penalty"] == 1.1
 
 
 class TestResponseValidator:
@@ -183,6 +205,53 @@ class TestResponseValidator:
         
         assert not is_valid
         assert any("Error message" in issue for issue in issues)
+    
+    def test_no_pattern_compilation_per_call(self, monkeypatch):
+        """Test validation reuses the patterns compiled at import time."""
+        import re
+        compiled = []
+        monkeypatch.setattr(re, "compile", lambda *args, **kwargs: compiled.append(args))
+        response = ChatResponse(
+            content="Here is a comprehensive answer based on the sources provided [1].",
+            model="test-model",
+            usage=None
+        )
+        
+        ResponseValidator.validate_chat_response(response, "openai")
+        
+        assert not compiled
+
+
+class TestModelLookup:
+    """Test BaseProvider.get_model_info indexes list_models() by ID."""
+    
+    class CountingProvider(BaseProvider):
+        def __init__(self, models):
+            super().__init__(id="fake", label="Fake", default_model=models[0].id)
+            self.models = models
+            self.list_calls = 0
+        
+        def list_models(self, credentials):
+            self.list_calls += 1
+            return self.models
+    
+    def test_lookup_builds_index_once(self):
+        """Test repeated lookups are served from the index."""
+        models = [ModelInfo(id=f"model-{i}", name=f"Model {i}", context_length=i) for i in range(500)]
+        provider = self.CountingProvider(models)
+        
+        assert provider.get_model_info({}, "model-499").context_length == 499
+        assert provider.get_model_info({}, "model-0") is models[0]
+        assert provider.list_calls == 1
+    
+    def test_unknown_model_refreshes_index(self):
+        """Test a miss re-lists models (the model may have just become available)."""
+        provider = self.CountingProvider([ModelInfo(id="a", name="A")])
+        
+        assert provider.get_model_info({}, "b") is None
+        provider.models = [ModelInfo(id="a", name="A"), ModelInfo(id="b", name="B")]
+        assert provider.get_model_info({}, "b").name == "B"
+        assert provider.list_calls == 2
 
 
 # Integration test markers
@@ -204,16 +273,28 @@ class TestProviderIntegration:
     FIXED_QUERY = "Summarize distribution shifts from my Zotero library"
     PROVIDERS = ["ollama", "openai", "anthropic", "google", "mistral", "groq", "openrouter"]
     
-    @pytest.mark.parametrize("provider_id", PROVIDERS)
-    def test_provider_consistency(self, provider_id):
-        """Test that each provider returns valid, consistent responses."""
+    @pytest.fixture(scope="class")
+    def shared_context(self):
+        """Retrieve evidence for FIXED_QUERY once; retrieval is provider-independent."""
         pytest.skip("Integration test - requires setup")
         # Implementation would go here when integration testing is set up
         # from backend.interface import ZoteroChatbot
         # chatbot = ZoteroChatbot(...)
-        # result = chatbot.chat(self.FIXED_QUERY)
-        # assert result["summary"]
-        # response = ChatResponse(content=result["summary"], model=provider_id, usage=None)
+        # results = chatbot.chroma.query_hybrid_rrf(query=chatbot.build_search_prompt(self.FIXED_QUERY), k=15)
+        # snippets = [{"citation_id": i + 1, "snippet": doc, **meta}
+        #             for i, (doc, meta) in enumerate(zip(results["documents"][0], results["metadatas"][0]))]
+        # yield chatbot, snippets
+    
+    @pytest.mark.parametrize("provider_id", PROVIDERS)
+    def test_provider_consistency(self, provider_id, shared_context):
+        """Test that each provider returns valid, consistent responses."""
+        pytest.skip("Integration test - requires setup")
+        # Only the LLM call runs per provider; the retrieved snippets are shared
+        # chatbot, snippets = shared_context
+        # chatbot.provider_manager.set_active_provider(provider_id)
+        # prompt = chatbot.build_answer_prompt(self.FIXED_QUERY, snippets)
+        # response = chatbot.provider_manager.chat([Message(role="user", content=prompt)])
+        # assert response.content
         # is_valid, _ = ResponseValidator.validate_chat_response(response, provider_id)
         # assert is_valid, f"{provider_id} failed validation"
 
@@ -0,0 +1,117 @@
+"""
+Tests for dynamic batching of dense queries.
+"""
+
+import threading
+import time
+
+import pytest
+from backend.query_batching import BatchedQueryDispatcher
+
+
+class FakeQuery:
+    """Query function returning, for each embedding, ids derived from its first component."""
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, query_embeddings, n_results, where=None):
+        self.release.wait()
+        self.calls.append({"n": len(query_embeddings), "n_results": n_results, "where": where})
+        if self.error:
+            raise self.error
+        return {
+            "ids": [[f"{emb[0]}:{i}" for i in range(n_results)] for emb in query_embeddings],
+            "distances": [[0.1 * i for i in range(n_results)] for _ in query_embeddings],
+            "embeddings": None,
+            "included": ["distances"],
+        }
+
+
+class TestBatchedQueryDispatcher:
+    """Test requests are coalesced and results fanned back out."""
+
+    def test_single_query(self):
+        """Test a lone query returns its own rows."""
+        fake = FakeQuery()
+        dispatcher = BatchedQueryDispatcher(fake)
+
+        results = dispatcher.query(query_embeddings=[[7]], n_results=2)
+
+        assert results["ids"] == [["7:0", "7:1"]]
+        assert results["embeddings"] is None
+        assert results["included"] == ["distances"]
+
+    def test_concurrent_queries_are_batched(self):
+        """Test queued queries share one call and each gets its own rows truncated to its k."""
+        fake = FakeQuery()
+        dispatcher = BatchedQueryDispatcher(fake, dispatch_timeout_ms=50)
+        fake.release.clear()  # Hold the first call so the rest queue up behind it
+        first = dispatcher.submit([[0]], n_results=1)
+        futures = [dispatcher.submit([[i]], n_results=i) for i in range(1, 6)]
+        fake.release.set()
+
+        assert first.result(timeout=5)["ids"] == [["0:0"]]
+        for i, future in enumerate(futures, start=1):
+            assert future.result(timeout=5)["ids"] == [[f"{i}:{j}" for j in range(i)]]
+        assert len(fake.calls) <= 2
+        assert fake.calls[-1]["n_results"] == 5
+
+    def test_different_filters_not_merged(self):
+        """Test queries with different where filters are sent separately."""
+        fake = FakeQuery()
+        dispatcher = BatchedQueryDispatcher(fake, dispatch_timeout_ms=50)
+        fake.release.clear()
+        futures = [
+            dispatcher.submit([[1]], n_results=1, where={"year": 2020}),
+            dispatcher.submit([[2]], n_results=1, where={"year": 2021}),
+        ]
+        fake.release.set()
+
+        assert [f.result(timeout=5)["ids"] for f in futures] == [[["1:0"]], [["2:0"]]]
+        assert {c["where"]["year"] for c in fake.calls} == {2020, 2021}
+
+    def test_lone_query_not_delayed(self):
+        """Test a query arriving at an idle dispatcher is sent without waiting out the window."""
+        dispatcher = BatchedQueryDispatcher(FakeQuery(), dispatch_timeout_ms=5000)
+
+        start = time.monotonic()
+        dispatcher.query([[1]], n_results=1)
+
+        assert time.monotonic() - start < 1
+
+    def test_fan_out_error_keeps_worker_alive(self):
+        """Test a malformed result fails its callers without stopping later queries."""
+        fake = FakeQuery()
+        broken = [True]
+        dispatcher = BatchedQueryDispatcher(lambda **kwargs: {"ids": [None]} if broken[0] else fake(**kwargs))
+
+        with pytest.raises(TypeError):
+            dispatcher.submit([[2]], n_results=1).result(timeout=5)
+        broken[0] = False
+        assert dispatcher.submit([[3]], n_results=1).result(timeout=5)["ids"] == [["3:0"]]
+
+    def test_close_stops_worker(self):
+        """Test close serves queued queries, stops the thread and rejects new queries."""
+        dispatcher = BatchedQueryDispatcher(FakeQuery())
+        dispatcher.query([[1]], n_results=1)
+        dispatcher.close()
+        dispatcher._worker.join(timeout=5)
+
+        assert not dispatcher._worker.is_alive()
+        with pytest.raises(RuntimeError):
+            dispatcher.submit([[1]], n_results=1)
+
+    def test_errors_reach_callers(self):
+        """Test a failing query call raises in the caller."""
+        dispatcher = BatchedQueryDispatcher(FakeQuery(error=ValueError("bad filter")))
+
+        with pytest.raises(ValueError, match="bad filter"):
+            dispatcher.query([[1]], n_results=1)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
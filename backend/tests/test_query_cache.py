@@ -0,0 +1,85 @@
+"""
+Tests for the LRU + TTL query result cache.
+"""
+
+import pytest
+from backend import query_cache
+from backend.query_cache import QueryCache
+
+
+class TestQueryCache:
+    """Test QueryCache lookups, eviction and expiry."""
+
+    def test_hit_and_miss_stats(self):
+        """Test hits and misses are counted."""
+        cache = QueryCache()
+        key = QueryCache.make_key("query_db", "transformers", 5)
+
+        assert cache.get(key) is None
+        cache.put(key, {"ids": [["a"]]})
+        assert cache.get(key) == {"ids": [["a"]]}
+        assert cache.get_stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "size": 1}
+
+    def test_key_ignores_filter_order(self):
+        """Test equal filters with different key order share a cache key."""
+        assert (QueryCache.make_key("q", "x", 5, {"a": 1, "b": 2})
+                == QueryCache.make_key("q", "x", 5, {"b": 2, "a": 1}))
+        assert QueryCache.make_key("q", "x", 5) != QueryCache.make_key("q", "x", 10)
+
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted when full."""
+        cache = QueryCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_ttl_expiry(self, monkeypatch):
+        """Test entries expire after the TTL."""
+        now = [1000.0]
+        monkeypatch.setattr(query_cache.time, "monotonic", lambda: now[0])
+        cache = QueryCache(ttl=300)
+        cache.put("a", 1)
+
+        now[0] += 299
+        assert cache.get("a") == 1
+        now[0] += 2
+        assert cache.get("a") is None
+        assert cache.get_stats()["size"] == 0
+
+    def test_returns_copies(self):
+        """Test callers mutating a result do not corrupt the cached entry."""
+        cache = QueryCache()
+        result = {"metadatas": [[{"title": "A"}]]}
+        cache.put("a", result)
+        result["metadatas"][0][0]["title"] = "changed"
+        cache.get("a")["metadatas"][0][0]["title"] = "changed again"
+
+        assert cache.get("a") == {"metadatas": [[{"title": "A"}]]}
+
+    def test_clear(self):
+        """Test clear drops all entries."""
+        cache = QueryCache()
+        cache.put("a", 1)
+        cache.clear()
+
+        assert cache.get("a") is None
+
+    def test_put_after_clear_is_dropped(self):
+        """Test a result computed before a clear is not stored after it."""
+        cache = QueryCache()
+        generation = cache.generation
+        cache.clear()
+        cache.put("a", 1, generation)
+
+        assert cache.get("a") is None
+        cache.put("a", 2, cache.generation)
+        assert cache.get("a") == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
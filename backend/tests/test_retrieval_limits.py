@@ -5,304 +5,238 @@ Tests the get_active_model_context_length() and get_retrieval_limits() methods
 to ensure they correctly scale retrieval parameters based on model context windows.
 """
 
+import subprocess
+import sys
 import unittest
-from unittest.mock import Mock, MagicMock, patch
-from backend.interface import ZoteroChatbot
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import Mock
+from backend.interface import ZoteroChatbot, compute_retrieval_limits
 from backend.model_providers.base import ModelInfo
 
 
+# Base limits for small/unknown context windows (1.0x multiplier), keyed by is_focused
+BASE = {
+    False: {"retrieval_k": 15, "rerank_top_k": 10, "max_snippets_per_paper": 3, "max_total_snippets": 6},
+    True: {"retrieval_k": 25, "rerank_top_k": 15, "max_snippets_per_paper": 8, "max_total_snippets": 10},
+}
+
+
+def expected(multiplier, is_focused):
+    """Expected limits for a tier multiplier and query mode."""
+    return {k: int(v * multiplier) for k, v in BASE[is_focused].items()}
+
+
+# (context length, expected multiplier), including the tier boundaries
+CASES = (
+    (None, 1.0),        # unknown (Ollama-style)
+    (16385, 1.0),       # GPT-3.5 (16k)
+    (31999, 1.0),       # just below 32k
+    (32000, 2.0),       # exactly at 32k
+    (32768, 2.0),       # GPT-4 (32k)
+    (99999, 2.0),       # just below 100k
+    (100000, 3.0),      # exactly at 100k
+    (100001, 3.0),      # just above 100k
+    (128000, 3.0),      # GPT-4 Turbo (128k)
+    (200000, 4.0),      # Claude Opus (200k)
+    (1_000_000, 5.0),   # exactly at 1M
+    (2_000_000, 5.0),   # Gemini 1.5 Pro (2M)
+)
+
+
+def mock_collaborators():
+    """Mocked ZoteroChatbot collaborators, injected instead of the real ones."""
+    return dict(zlib=Mock(), chroma=Mock(), conversation_store=Mock(), query_condenser=Mock())
+
+
+class _StubProvider:
+    """Provider stand-in serving fixed models and recording looked-up IDs."""
+
+    def __init__(self, models, error=None):
+        self._models = {m.id: m for m in models}
+        self._error = error
+        self.lookups = []
+
+    def get_model_info(self, credentials, model_id):
+        self.lookups.append(model_id)
+        if self._error:
+            raise self._error
+        return self._models.get(model_id)
+
+
+def _stub_pm(provider, model):
+    """ProviderManager stand-in with a fixed provider and model."""
+    return SimpleNamespace(
+        active_provider_id="stub",
+        get_active_provider=lambda: provider,
+        get_active_model=lambda: model,
+        get_credentials=lambda provider_id=None: {},
+    )
+
+
+class TestComputeRetrievalLimits(unittest.TestCase):
+    """Test the pure context-window to retrieval-limit scaling."""
+
+    def test_get_retrieval_limits_tiers(self):
+        """Test retrieval limits scale with the model's context window tier."""
+        for context_length, multiplier in CASES:
+            for is_focused in (False, True):
+                with self.subTest(context=context_length, mult=multiplier, focused=is_focused):
+                    limits = compute_retrieval_limits(context_length, is_focused)
+                    self.assertEqual(limits, expected(multiplier, is_focused))
+
+    def test_limits_are_shared_and_read_only(self):
+        """Test repeated calls return the same immutable preset."""
+        limits = compute_retrieval_limits(128000, True)
+
+        self.assertIs(limits, compute_retrieval_limits(100000, True))
+        with self.assertRaises(TypeError):
+            limits["retrieval_k"] = 1
+
+
 class TestRetrievalLimits(unittest.TestCase):
-    """Test suite for dynamic retrieval limits based on model context windows."""
+    """Test suite for looking up the active model's context window."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Build one chatbot with mocked dependencies, shared by all tests."""
+        # Inject mocks for the database and vector store to avoid file I/O
+        cls.chatbot = ZoteroChatbot(
+            db_path="/fake/path/zotero.sqlite",
+            chroma_path="/fake/path/chroma",
+            active_provider_id="ollama",
+            active_model="llama3.2",
+            credentials={},
+            embedding_model_id="bge-base",
+            **mock_collaborators()
+        )
 
     def setUp(self):
-        """Set up test fixtures with mocked dependencies."""
-        # Mock the database and vector store to avoid file I/O
-        with patch('backend.interface.ZoteroLibrary'), \
-             patch('backend.interface.ChromaClient'), \
-             patch('backend.interface.ConversationStore'), \
-             patch('backend.interface.QueryCondenser'):
-
-            self.chatbot = ZoteroChatbot(
-                db_path="/fake/path/zotero.sqlite",
-                chroma_path="/fake/path/chroma",
-                active_provider_id="ollama",
-                active_model="llama3.2",
-                credentials={},
-                embedding_model_id="bge-base"
-            )
-
-    def test_get_retrieval_limits_unknown_context(self):
-        """Test retrieval limits when context length is unknown (Ollama-style)."""
-        # Mock get_active_model_context_length to return None
-        self.chatbot.get_active_model_context_length = Mock(return_value=None)
-
-        # Test broad mode
-        limits_broad = self.chatbot.get_retrieval_limits(is_focused=False)
-        self.assertEqual(limits_broad["retrieval_k"], 15)
-        self.assertEqual(limits_broad["rerank_top_k"], 10)
-        self.assertEqual(limits_broad["max_snippets_per_paper"], 3)
-        self.assertEqual(limits_broad["max_total_snippets"], 6)
-
-        # Test focused mode
-        limits_focused = self.chatbot.get_retrieval_limits(is_focused=True)
-        self.assertEqual(limits_focused["retrieval_k"], 25)
-        self.assertEqual(limits_focused["rerank_top_k"], 15)
-        self.assertEqual(limits_focused["max_snippets_per_paper"], 8)
-        self.assertEqual(limits_focused["max_total_snippets"], 10)
-
-    def test_get_retrieval_limits_small_context(self):
-        """Test retrieval limits for small context models (GPT-3.5 style - 16k)."""
-        # Mock context_length for small model
-        self.chatbot.get_active_model_context_length = Mock(return_value=16385)
-
-        # Should use 1.0x multiplier (default tier)
-        limits_broad = self.chatbot.get_retrieval_limits(is_focused=False)
-        self.assertEqual(limits_broad["retrieval_k"], 15)
-        self.assertEqual(limits_broad["max_total_snippets"], 6)
-
-        limits_focused = self.chatbot.get_retrieval_limits(is_focused=True)
-        self.assertEqual(limits_focused["retrieval_k"], 25)
-        self.assertEqual(limits_focused["max_total_snippets"], 10)
-
-    def test_get_retrieval_limits_medium_context(self):
-        """Test retrieval limits for medium context models (GPT-4 - 32k)."""
-        # Mock context_length for medium model
-        self.chatbot.get_active_model_context_length = Mock(return_value=32768)
-
-        # Should use 2.0x multiplier
-        limits_broad = self.chatbot.get_retrieval_limits(is_focused=False)
-        self.assertEqual(limits_broad["retrieval_k"], 30)  # 15 * 2.0
-        self.assertEqual(limits_broad["rerank_top_k"], 20)  # 10 * 2.0
-        self.assertEqual(limits_broad["max_snippets_per_paper"], 6)  # 3 * 2.0
-        self.assertEqual(limits_broad["max_total_snippets"], 12)  # 6 * 2.0
-
-        limits_focused = self.chatbot.get_retrieval_limits(is_focused=True)
-        self.assertEqual(limits_focused["retrieval_k"], 50)  # 25 * 2.0
-        self.assertEqual(limits_focused["rerank_top_k"], 30)  # 15 * 2.0
-        self.assertEqual(limits_focused["max_snippets_per_paper"], 16)  # 8 * 2.0
-        self.assertEqual(limits_focused["max_total_snippets"], 20)  # 10 * 2.0
-
-    def test_get_retrieval_limits_large_context_gpt4(self):
-        """Test retrieval limits for large context models (GPT-4 Turbo - 128k)."""
-        # Mock context_length for GPT-4 Turbo
-        self.chatbot.get_active_model_context_length = Mock(return_value=128000)
-
-        # Should use 3.0x multiplier
-        limits_broad = self.chatbot.get_retrieval_limits(is_focused=False)
-        self.assertEqual(limits_broad["retrieval_k"], 45)  # 15 * 3.0
-        self.assertEqual(limits_broad["rerank_top_k"], 30)  # 10 * 3.0
-        self.assertEqual(limits_broad["max_snippets_per_paper"], 9)  # 3 * 3.0
-        self.assertEqual(limits_broad["max_total_snippets"], 18)  # 6 * 3.0
-
-        limits_focused = self.chatbot.get_retrieval_limits(is_focused=True)
-        self.assertEqual(limits_focused["retrieval_k"], 75)  # 25 * 3.0
-        self.assertEqual(limits_focused["rerank_top_k"], 45)  # 15 * 3.0
-        self.assertEqual(limits_focused["max_snippets_per_paper"], 24)  # 8 * 3.0
-        self.assertEqual(limits_focused["max_total_snippets"], 30)  # 10 * 3.0
-
-    def test_get_retrieval_limits_xlarge_context_claude(self):
-        """Test retrieval limits for XLarge context models (Claude Opus - 200k)."""
-        # Mock context_length for Claude Opus
-        self.chatbot.get_active_model_context_length = Mock(return_value=200000)
-
-        # Should use 4.0x multiplier
-        limits_broad = self.chatbot.get_retrieval_limits(is_focused=False)
-        self.assertEqual(limits_broad["retrieval_k"], 60)  # 15 * 4.0
-        self.assertEqual(limits_broad["rerank_top_k"], 40)  # 10 * 4.0
-        self.assertEqual(limits_broad["max_snippets_per_paper"], 12)  # 3 * 4.0
-        self.assertEqual(limits_broad["max_total_snippets"], 24)  # 6 * 4.0
-
-        limits_focused = self.chatbot.get_retrieval_limits(is_focused=True)
-        self.assertEqual(limits_focused["retrieval_k"], 100)  # 25 * 4.0
-        self.assertEqual(limits_focused["rerank_top_k"], 60)  # 15 * 4.0
-        self.assertEqual(limits_focused["max_snippets_per_paper"], 32)  # 8 * 4.0
-        self.assertEqual(limits_focused["max_total_snippets"], 40)  # 10 * 4.0
-
-    def test_get_retrieval_limits_xxlarge_context_gemini(self):
-        """Test retrieval limits for XXLarge context models (Gemini 1.5 Pro - 2M)."""
-        # Mock context_length for Gemini 1.5 Pro
-        self.chatbot.get_active_model_context_length = Mock(return_value=2000000)
-
-        # Should use 5.0x multiplier
-        limits_broad = self.chatbot.get_retrieval_limits(is_focused=False)
-        self.assertEqual(limits_broad["retrieval_k"], 75)  # 15 * 5.0
-        self.assertEqual(limits_broad["rerank_top_k"], 50)  # 10 * 5.0
-        self.assertEqual(limits_broad["max_snippets_per_paper"], 15)  # 3 * 5.0
-        self.assertEqual(limits_broad["max_total_snippets"], 30)  # 6 * 5.0
-
-        limits_focused = self.chatbot.get_retrieval_limits(is_focused=True)
-        self.assertEqual(limits_focused["retrieval_k"], 125)  # 25 * 5.0
-        self.assertEqual(limits_focused["rerank_top_k"], 75)  # 15 * 5.0
-        self.assertEqual(limits_focused["max_snippets_per_paper"], 40)  # 8 * 5.0
-        self.assertEqual(limits_focused["max_total_snippets"], 50)  # 10 * 5.0
-
-    def test_context_length_edge_cases(self):
-        """Test edge cases for context length tiers."""
-        # Test boundary between tiers
-
-        # Just below 32k threshold - should use 1.0x
-        self.chatbot.get_active_model_context_length = Mock(return_value=31999)
-        limits = self.chatbot.get_retrieval_limits(is_focused=False)
-        self.assertEqual(limits["max_total_snippets"], 6)  # 6 * 1.0
-
-        # Exactly at 32k threshold - should use 2.0x
-        self.chatbot.get_active_model_context_length = Mock(return_value=32000)
-        limits = self.chatbot.get_retrieval_limits(is_focused=False)
-        self.assertEqual(limits["max_total_snippets"], 12)  # 6 * 2.0
-
-        # Just above 100k threshold - should use 3.0x
-        self.chatbot.get_active_model_context_length = Mock(return_value=100001)
-        limits = self.chatbot.get_retrieval_limits(is_focused=False)
-        self.assertEqual(limits["max_total_snippets"], 18)  # 6 * 3.0
-
-        # Exactly at 200k threshold - should use 4.0x
-        self.chatbot.get_active_model_context_length = Mock(return_value=200000)
-        limits = self.chatbot.get_retrieval_limits(is_focused=False)
-        self.assertEqual(limits["max_total_snippets"], 24)  # 6 * 4.0
-
-        # Exactly at 1M threshold - should use 5.0x
-        self.chatbot.get_active_model_context_length = Mock(return_value=1000000)
-        limits = self.chatbot.get_retrieval_limits(is_focused=False)
-        self.assertEqual(limits["max_total_snippets"], 30)  # 6 * 5.0
+        """Forget context lengths cached by a previous test."""
+        self.chatbot._context_length_cache.clear()
 
     def test_get_active_model_context_length_success(self):
         """Test successful retrieval of model context length."""
-        # Mock provider and model info
-        mock_provider = Mock()
-        mock_model_info = ModelInfo(
-            id="gpt-4o",
-            name="GPT-4o",
-            description="Most capable model",
-            context_length=128000
-        )
-        mock_provider.list_models = Mock(return_value=[mock_model_info])
-
-        self.chatbot.provider_manager.get_active_provider = Mock(return_value=mock_provider)
-        self.chatbot.provider_manager.get_active_model = Mock(return_value="gpt-4o")
-        self.chatbot.provider_manager.get_credentials = Mock(return_value={})
+        provider = _StubProvider([
+            ModelInfo(id="gpt-4o", name="GPT-4o", description="Most capable model", context_length=128000)
+        ])
+        self.chatbot.provider_manager = _stub_pm(provider, "gpt-4o")
 
         # Call the method
         context_length = self.chatbot.get_active_model_context_length()
 
         # Verify
         self.assertEqual(context_length, 128000)
-        mock_provider.list_models.assert_called_once()
+        self.assertEqual(provider.lookups, ["gpt-4o"])
 
-    def test_get_active_model_context_length_no_match(self):
-        """Test when active model is not in the provider's model list."""
-        # Mock provider with different model
-        mock_provider = Mock()
-        mock_model_info = ModelInfo(
-            id="gpt-3.5-turbo",
-            name="GPT-3.5 Turbo",
-            context_length=16385
-        )
-        mock_provider.list_models = Mock(return_value=[mock_model_info])
+    def test_get_active_model_context_length_cached(self):
+        """Test repeated lookups for the same provider/model skip the provider."""
+        provider = _StubProvider([ModelInfo(id="gpt-4o", name="GPT-4o", context_length=128000)])
+        self.chatbot.provider_manager = _stub_pm(provider, "gpt-4o")
 
-        self.chatbot.provider_manager.get_active_provider = Mock(return_value=mock_provider)
-        self.chatbot.provider_manager.get_active_model = Mock(return_value="gpt-4o")  # Different model
-        self.chatbot.provider_manager.get_credentials = Mock(return_value={})
+        self.assertEqual(self.chatbot.get_active_model_context_length(), 128000)
+        self.assertEqual(self.chatbot.get_active_model_context_length(), 128000)
+        self.assertEqual(provider.lookups, ["gpt-4o"])
 
-        # Call the method
-        context_length = self.chatbot.get_active_model_context_length()
+        # Switching model triggers a fresh lookup
+        self.chatbot.provider_manager = _stub_pm(provider, "gpt-4o-mini")
+        self.assertIsNone(self.chatbot.get_active_model_context_length())
+        self.assertEqual(provider.lookups, ["gpt-4o", "gpt-4o-mini"])
+
+    def test_get_active_model_context_length_miss_not_cached(self):
+        """Test a model the provider lists only later is looked up again."""
+        provider = _StubProvider([])
+        self.chatbot.provider_manager = _stub_pm(provider, "llama3.2")
+
+        self.assertIsNone(self.chatbot.get_active_model_context_length())
+
+        # e.g. the model was pulled in Ollama after the first chat turn
+        provider._models["llama3.2"] = ModelInfo(id="llama3.2", name="Llama 3.2", context_length=128000)
+        self.assertEqual(self.chatbot.get_active_model_context_length(), 128000)
+        self.assertEqual(provider.lookups, ["llama3.2", "llama3.2"])
+
+    def test_get_active_model_context_length_no_match(self):
+        """Test when active model is not in the provider's model list."""
+        provider = _StubProvider([ModelInfo(id="gpt-3.5-turbo", name="GPT-3.5 Turbo", context_length=16385)])
+        self.chatbot.provider_manager = _stub_pm(provider, "gpt-4o")  # Different model
 
         # Should return None when model not found
-        self.assertIsNone(context_length)
+        self.assertIsNone(self.chatbot.get_active_model_context_length())
 
     def test_get_active_model_context_length_exception_handling(self):
         """Test graceful handling of exceptions when querying context length."""
-        # Mock provider that raises an exception
-        self.chatbot.provider_manager.get_active_provider = Mock(
-            side_effect=Exception("Provider unavailable")
-        )
-
-        # Call the method
-        context_length = self.chatbot.get_active_model_context_length()
+        provider = _StubProvider([], error=Exception("Provider unavailable"))
+        self.chatbot.provider_manager = _stub_pm(provider, "gpt-4o")
 
         # Should return None on exception (graceful fallback)
-        self.assertIsNone(context_length)
+        self.assertIsNone(self.chatbot.get_active_model_context_length())
 
     def test_get_active_model_context_length_none_in_modelinfo(self):
         """Test when ModelInfo has context_length=None (Ollama-style)."""
-        # Mock provider with model that has None context_length
-        mock_provider = Mock()
-        mock_model_info = ModelInfo(
-            id="llama3.2",
-            name="Llama 3.2",
-            context_length=None  # Ollama doesn't provide this
-        )
-        mock_provider.list_models = Mock(return_value=[mock_model_info])
-
-        self.chatbot.provider_manager.get_active_provider = Mock(return_value=mock_provider)
-        self.chatbot.provider_manager.get_active_model = Mock(return_value="llama3.2")
-        self.chatbot.provider_manager.get_credentials = Mock(return_value={})
-
-        # Call the method
-        context_length = self.chatbot.get_active_model_context_length()
+        provider = _StubProvider([
+            ModelInfo(id="llama3.2", name="Llama 3.2", context_length=None)  # Ollama doesn't provide this
+        ])
+        self.chatbot.provider_manager = _stub_pm(provider, "llama3.2")
 
         # Should return None when context_length is None
-        self.assertIsNone(context_length)
+        self.assertIsNone(self.chatbot.get_active_model_context_length())
 
 
 class TestRetrievalLimitsIntegration(unittest.TestCase):
     """Integration tests verifying limits are used correctly in chat flow."""
 
-    def setUp(self):
-        """Set up test fixtures."""
-        with patch('backend.interface.ZoteroLibrary'), \
-             patch('backend.interface.ChromaClient'), \
-             patch('backend.interface.ConversationStore'), \
-             patch('backend.interface.QueryCondenser'):
-
-            self.chatbot = ZoteroChatbot(
-                db_path="/fake/path/zotero.sqlite",
-                chroma_path="/fake/path/chroma",
-                active_provider_id="google",
-                active_model="gemini-1.5-pro",
-                credentials={"google": {"api_key": "fake"}},
-                embedding_model_id="bge-base"
-            )
+    @classmethod
+    def setUpClass(cls):
+        """Build one chatbot with mocked dependencies, shared by all tests."""
+        cls.chatbot = ZoteroChatbot(
+            db_path="/fake/path/zotero.sqlite",
+            chroma_path="/fake/path/chroma",
+            active_provider_id="google",
+            active_model="gemini-1.5-pro",
+            credentials={"google": {"api_key": "fake"}},
+            embedding_model_id="bge-base",
+            **mock_collaborators()
+        )
 
     def test_chat_uses_dynamic_limits_gemini(self):
         """Test that chat() method uses dynamic limits for Gemini."""
         # Mock context length for Gemini
-        self.chatbot.get_active_model_context_length = Mock(return_value=2000000)
+        self.chatbot.get_active_model_context_length = lambda: 2000000
 
-        # Get limits
-        limits = self.chatbot.get_retrieval_limits(is_focused=False)
-
-        # Verify Gemini gets 5.0x multiplier
-        self.assertEqual(limits["retrieval_k"], 75)  # 15 * 5.0
-        self.assertEqual(limits["max_total_snippets"], 30)  # 6 * 5.0
-
-        # Verify focused mode
-        limits_focused = self.chatbot.get_retrieval_limits(is_focused=True)
-        self.assertEqual(limits_focused["retrieval_k"], 125)  # 25 * 5.0
-        self.assertEqual(limits_focused["max_total_snippets"], 50)  # 10 * 5.0
+        # Verify Gemini gets 5.0x multiplier in both modes
+        self.assertEqual(self.chatbot.get_retrieval_limits(is_focused=False), expected(5.0, False))
+        self.assertEqual(self.chatbot.get_retrieval_limits(is_focused=True), expected(5.0, True))
 
     def test_focus_mode_transitions(self):
         """Test that limits update correctly when focus mode changes."""
-        # Mock small context initially
-        self.chatbot.get_active_model_context_length = Mock(return_value=None)
-
-        # Start with broad mode (no filters)
-        limits_broad = self.chatbot.get_retrieval_limits(is_focused=False)
-        self.assertEqual(limits_broad["max_total_snippets"], 6)
-
-        # Switch to focused mode (filters active)
-        limits_focused = self.chatbot.get_retrieval_limits(is_focused=True)
-        self.assertEqual(limits_focused["max_total_snippets"], 10)
-
-        # Now with large context
-        self.chatbot.get_active_model_context_length = Mock(return_value=200000)
-
-        # Broad mode with large context
-        limits_broad_large = self.chatbot.get_retrieval_limits(is_focused=False)
-        self.assertEqual(limits_broad_large["max_total_snippets"], 24)  # 6 * 4.0
-
-        # Focused mode with large context
-        limits_focused_large = self.chatbot.get_retrieval_limits(is_focused=True)
-        self.assertEqual(limits_focused_large["max_total_snippets"], 40)  # 10 * 4.0
+        # Small/unknown context first, then large context
+        for context_length, multiplier in ((None, 1.0), (200000, 4.0)):
+            self.chatbot.get_active_model_context_length = lambda: context_length
+
+            # Broad mode (no filters), then focused mode (filters active)
+            for is_focused in (False, True):
+                with self.subTest(context=context_length, focused=is_focused):
+                    self.assertEqual(
+                        self.chatbot.get_retrieval_limits(is_focused=is_focused),
+                        expected(multiplier, is_focused)
+                    )
+
+
+class TestLazyImports(unittest.TestCase):
+    """Importing backend.interface must not load the vector store or embedding models."""
+
+    def test_interface_import_is_light(self):
+        """Test chromadb and sentence_transformers stay unloaded (checked in a fresh interpreter)."""
+        code = (
+            "import sys, backend.interface; "
+            "print('loaded:', [m for m in ('chromadb', 'sentence_transformers') if m in sys.modules])"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=Path(__file__).resolve().parents[2],
+            capture_output=True, text=True, check=True
+        )
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "loaded: []")
 
 
 if __name__ == "__main__":
@@ -2,11 +2,136 @@
 import chromadb
 from chromadb.config import Settings
 import os
-from typing import List, Dict, Any, Iterable, Optional
-from rank_bm25 import BM25Okapi
-import pickle
+import json
+import hashlib
+import operator
+from functools import lru_cache
+from itertools import islice
+import sqlite3
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import bm25s
+from bm25s.tokenization import Tokenizer
 import numpy as np
 
+from backend.query_batching import BatchedQueryDispatcher
+from backend.query_cache import QueryCache
+
+# BM25 scoring backend: "auto" uses bm25s' numba JIT-compiled scorer when numba
+# is installed and falls back to numpy otherwise
+BM25_BACKEND = os.getenv("BM25_BACKEND", "auto")
+
+# Tokenizer vocabulary file saved inside the BM25 index directory
+BM25_VOCAB_FILE = "vocab.tokenizer.json"
+
+# Storage dtype of the sync_db embedding cache: float16 halves its size, and
+# unit-scale embedding components keep ~3 significant digits (well within
+# what cosine retrieval can distinguish)
+EMB_CACHE_DTYPE = np.float16
+
+# Chunks per collection.get() page when reading the whole collection
+GET_PAGE_SIZE = 10000
+
+# Chunks per collection.add() call in sync_db, within Chroma's recommended range
+SYNC_BATCH_SIZE = 200
+SYNC_BATCH_SIZE_RANGE = (50, 250)
+
+# HNSW graph parameters for newly created collections (existing collections keep the
+# parameters they were built with): a denser graph built with a wider beam gives
+# better recall per search step, at some extra indexing time
+DEFAULT_HNSW_PARAMS = {"hnsw:M": 32, "hnsw:construction_ef": 200, "hnsw:search_ef": 100}
+
+# Field operators supported in where clauses matched on the client
+_WHERE_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+    "$contains": lambda value, target: target in str(value),
+    "$in": lambda value, target: value in target,
+    "$nin": lambda value, target: value not in target,
+}
+
+
+def _compile_where(where: Dict[str, Any]) -> Callable[[Dict[str, Any]], bool]:
+    """Build a predicate over metadata dicts for a where clause."""
+    predicates = []
+    for key, condition in where.items():
+        # A logical operator decides the match, so later keys are not checked
+        if key == "$and":
+            clauses = [_compile_where(c) for c in condition]
+            predicates.append(lambda metadata: all(p(metadata) for p in clauses))
+            break
+        elif key == "$or":
+            clauses = [_compile_where(c) for c in condition]
+            predicates.append(lambda metadata: any(p(metadata) for p in clauses))
+            break
+        elif key == "$not":
+            clause = _compile_where(condition)
+            predicates.append(lambda metadata: not clause(metadata))
+            break
+        elif isinstance(condition, dict):
+            # Field condition (e.g., {"year": {"$gte": 2020}}); unknown operators are ignored
+            checks = [(_WHERE_OPERATORS[op], target) for op, target in condition.items() if op in _WHERE_OPERATORS]
+            
+            def field_matches(metadata, key=key, checks=checks):
+                value = metadata.get(key)
+                return value is not None and all(check(value, target) for check, target in checks)
+            predicates.append(field_matches)
+        else:
+            # Direct equality check
+            predicates.append(lambda metadata, key=key, condition=condition: metadata.get(key) == condition)
+    
+    if len(predicates) == 1:
+        return predicates[0]
+    return lambda metadata: all(p(metadata) for p in predicates)
+
+
+@lru_cache(maxsize=256)
+def _compile_where_cached(where_json: str) -> Callable[[Dict[str, Any]], bool]:
+    return _compile_where(json.loads(where_json))
+
+
+def compile_where(where: Dict[str, Any]) -> Callable[[Dict[str, Any]], bool]:
+    """
+    Compile a where clause into a predicate over metadata dicts, so filtering many
+    rows does not re-walk the clause per row. Compiled clauses are cached.
+    """
+    try:
+        # Key order matters (a logical operator ends the clause), so keys are not sorted
+        where_json = json.dumps(where)
+    except TypeError:
+        return _compile_where(where)
+    return _compile_where_cached(where_json)
+
+
+@lru_cache(maxsize=None)
+def _embed_utils():
+    """Import backend.embed_utils once, on first use (importing it loads the embedding
+    and reranker models, so it is kept out of module import time)."""
+    from backend import embed_utils
+    return embed_utils
+
+
+@lru_cache(maxsize=256)
+def _embed_query_cached(query: str, model_id: Optional[str] = None) -> np.ndarray:
+    """Embed a query once per (query, model_id); repeated queries (pagination, re-rank
+    tuning) skip the model forward pass. Returned arrays are read-only float32."""
+    embedding = np.asarray(_embed_utils().get_embedding(query, model_id=model_id), dtype=np.float32)
+    embedding.setflags(write=False)
+    return embedding
+
+
+def _stop_query_threads(dispatcher: BatchedQueryDispatcher, executor: ThreadPoolExecutor) -> None:
+    """Stop a client's query threads (runs on close() or when the client is collected)."""
+    dispatcher.close()
+    executor.shutdown(wait=False)
+
+
 class ChromaClient:
     """
     Administers user interactions with the Chroma vector database for Zotero library items.
@@ -19,9 +144,14 @@ class ChromaClient:
     Each embedding model gets its own collection to prevent dimension mismatch errors.
     """
 
-    def __init__(self, db_path: str, collection_name: str = "zotero_lib", embedding_model_id: str = "bge-base"):
+    def __init__(self, db_path: str, collection_name: str = "zotero_lib", embedding_model_id: str = "bge-base",
+                 sync_batch_size: int = SYNC_BATCH_SIZE, hnsw_params: Optional[Dict[str, Any]] = None):
+        low, high = SYNC_BATCH_SIZE_RANGE
+        if not low <= sync_batch_size <= high:
+            raise ValueError(f"sync_batch_size must be between {low} and {high}, got {sync_batch_size}")
         self.db_path = db_path
         self.embedding_model_id = embedding_model_id
+        self.sync_batch_size = sync_batch_size
         # Include embedding model in collection name to avoid dimension conflicts
         self.collection_name = f"{collection_name}_{embedding_model_id}"
         os.makedirs(self.db_path, exist_ok=True)
@@ -29,20 +159,69 @@ class ChromaClient:
         
         # Create collection WITHOUT an embedding function (we provide embeddings manually)
         # This prevents ChromaDB from using its default all-MiniLM-L6-v2 (384 dims)
+        self._collection_metadata = {
+            **DEFAULT_HNSW_PARAMS,
+            **(hnsw_params or {}),
+            "hnsw:space": "cosine",  # Use cosine similarity for retrieval
+            "embedding_model": embedding_model_id  # Track which model created this collection
+        }
         self.collection = self.chroma_client.get_or_create_collection(
             name=self.collection_name,
-            metadata={
-                "hnsw:space": "cosine",  # Use cosine similarity for retrieval
-                "embedding_model": embedding_model_id  # Track which model created this collection
-            }
+            metadata=self._collection_metadata
         )
         
         # BM25 index for sparse retrieval (loaded lazily)
-        # Each embedding model has its own BM25 index
+        # Each embedding model has its own BM25 index (a bm25s index directory)
         self.bm25_index = None
-        self.bm25_corpus = None
-        self.bm25_ids = None
-        self.bm25_path = os.path.join(self.db_path, f"bm25_index_{embedding_model_id}.pkl")
+        self.bm25_ids = None  # Chunk ID per BM25 document, as a numpy object array
+        # Maps words to the index's token IDs; saved with the index so queries use the same vocabulary
+        self.bm25_tokenizer = None
+        self.bm25_path = os.path.join(self.db_path, f"bm25s_index_{embedding_model_id}")
+        # Pickled rank_bm25 index written by older versions; replaced on first load
+        self._legacy_bm25_path = os.path.join(self.db_path, f"bm25_index_{embedding_model_id}.pkl")
+        
+        # Chunk embeddings keyed by content hash, so re-syncing unchanged text skips the model.
+        # One cache file per embedding model and storage dtype (opened lazily; the connection
+        # is shared by indexing threads and guarded by _emb_cache_lock)
+        self.emb_cache_path = os.path.join(
+            self.db_path, f"emb_cache_{embedding_model_id}_{np.dtype(EMB_CACHE_DTYPE).name}.db"
+        )
+        self._emb_cache_conn: Optional[sqlite3.Connection] = None
+        self._emb_cache_lock = threading.Lock()
+        
+        # Recent query results; cleared whenever the collection or BM25 index changes
+        self.query_cache = QueryCache()
+        # Indexed item IDs for item_exists(), loaded on first use and kept current by
+        # add_chunks/delete_item
+        self._indexed_ids_cache: Optional[Set[str]] = None
+        # Coalesces concurrent dense queries into batched collection.query() calls. The
+        # dispatcher's thread only holds a weak reference to the client, so a replaced
+        # client can be collected (its dispatcher is then stopped by the finalizer)
+        client_ref = weakref.ref(self)
+        self.query_dispatcher = BatchedQueryDispatcher(lambda **kwargs: client_ref().collection.query(**kwargs))
+        # Runs the BM25 arm of hybrid queries while the calling thread runs the dense arm
+        self._bm25_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25-query")
+        self._finalizer = weakref.finalize(self, _stop_query_threads, self.query_dispatcher, self._bm25_executor)
+
+    def close(self) -> None:
+        """
+        Stop the client's background query threads and close its embedding cache. Call
+        when the client is replaced; dense and hybrid queries on a closed client raise
+        RuntimeError.
+        """
+        self._finalizer()
+        with self._emb_cache_lock:
+            if self._emb_cache_conn is not None:
+                self._emb_cache_conn.close()
+                self._emb_cache_conn = None
+
+    def set_search_ef(self, search_ef: int) -> None:
+        """
+        Set the HNSW search beam width for dense queries (higher = better recall,
+        slower queries). Applies to existing collections too.
+        """
+        self.collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+        self.query_cache.clear()
 
     def add_chunks(self,
         ids: List[str],
@@ -59,6 +238,14 @@ class ChromaClient:
             metadatas=metadatas,
             embeddings=embeddings,
         )
+        # Clear after the write, so a query racing the add cannot re-cache pre-add results
+        self.query_cache.clear()
+        # Keep the indexed item ID set current (forget it if the chunks carry no item IDs)
+        if self._indexed_ids_cache is not None:
+            if metadatas is None:
+                self._indexed_ids_cache = None
+            else:
+                self._indexed_ids_cache.update(str(m['item_id']) for m in metadatas if m and 'item_id' in m)
 
     def query_db(self,
         query: str,
@@ -73,16 +260,21 @@ class ChromaClient:
         consistent 768-dimensional embeddings. DO NOT use query_texts parameter
         as it would trigger ChromaDB's default embedding function.
         """
-        from backend.embed_utils import get_embedding
+        cache_key = QueryCache.make_key("query_db", query, k, where)
+        cache_generation = self.query_cache.generation
+        cached = self.query_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         # Manually embed query to ensure consistent dimensions
-        query_embedding = get_embedding(query)
+        query_embedding = _embed_query_cached(query, self.embedding_model_id)
         
-        results = self.collection.query(
-            query_embeddings=[query_embedding.tolist()],  # Use query_embeddings, not query_texts!
+        results = self.query_dispatcher.query(
+            query_embeddings=[query_embedding],  # Use query_embeddings, not query_texts!
             n_results=k,
             where=where,
         )
+        self.query_cache.put(cache_key, results, cache_generation)
         return results
     
     def query_bm25(self, query: str, k: int = 10) -> List[Dict[str, Any]]:
@@ -95,65 +287,87 @@ class ChromaClient:
         Returns:
             List of dicts with 'id', 'score', 'document', and 'metadata'
         """
+        hits = self._bm25_hits(query, k)
+        documents = self._get_documents([doc_id for doc_id, _ in hits])
+        
+        # Keep BM25 score order (get() does not preserve the order of ids)
+        return [
+            {'id': doc_id, 'score': score, 'document': documents[doc_id][0], 'metadata': documents[doc_id][1]}
+            for doc_id, score in hits
+            if doc_id in documents
+        ]
+    
+    def _bm25_hits(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Top k (chunk ID, BM25 score) pairs with a positive score, best first."""
         if self.bm25_index is None:
             self._load_bm25_index()
         
         if self.bm25_index is None:
             return []  # No BM25 index available
         
-        # Tokenize query (simple whitespace tokenization)
-        query_tokens = query.lower().split()
-        
-        # Get BM25 scores
-        scores = self.bm25_index.get_scores(query_tokens)
-        
-        # Get top k indices
-        top_indices = np.argsort(scores)[::-1][:k]
-        
-        # Retrieve documents from ChromaDB
-        results = []
-        for idx in top_indices:
-            if scores[idx] > 0:  # Only include results with positive scores
-                doc_id = self.bm25_ids[idx]
-                # Get full document and metadata from ChromaDB
-                chroma_result = self.collection.get(ids=[doc_id])
-                if chroma_result['ids']:
-                    results.append({
-                        'id': doc_id,
-                        'score': float(scores[idx]),
-                        'document': chroma_result['documents'][0],
-                        'metadata': chroma_result['metadatas'][0]
-                    })
+        # Tokenize query into the index's token IDs (words not in the vocabulary are dropped)
+        query_tokens = self.bm25_tokenizer.tokenize(
+            [query], update_vocab=False, return_as="ids", show_progress=False
+        )
         
-        return results
+        # Get top k indices and their BM25 scores (scores are precomputed at index time)
+        k = min(k, len(self.bm25_ids))
+        if k <= 0:
+            return []
+        top_indices, scores = self.bm25_index.retrieve(query_tokens, k=k, show_progress=False)
+        
+        # Only include results with positive scores
+        positive = scores[0] > 0
+        return list(zip(self.bm25_ids[top_indices[0][positive]].tolist(), scores[0][positive].tolist()))
     
-    def query_hybrid(self, query: str, k: int = 10, where: Optional[Dict[str, Any]] = None, embedding_model_id: str = "bge-base") -> Dict[str, Any]:
+    def _get_documents(self, ids: List[str]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """Fetch (document, metadata) for chunk IDs in a single ChromaDB call."""
+        if not ids:
+            return {}
+        result = self.collection.get(ids=ids, include=['documents', 'metadatas'])
+        return dict(zip(result['ids'], zip(result['documents'], result['metadatas'])))
+    
+    def query_hybrid(self, query: str, k: int = 10, where: Optional[Dict[str, Any]] = None, embedding_model_id: str = "bge-base", rrf_k: int = 60) -> Dict[str, Any]:
         """Hybrid search combining dense (semantic) and sparse (BM25) retrieval.
         
         Best practice from Reddit thread: Retrieve top-k from both methods,
         create a union, then re-rank using cross-encoder.
         
+        The union is ordered by Reciprocal Rank Fusion of the two rankings, so it is
+        usable without the cross-encoder pass.
+        
         Args:
             query: Search query
             k: Number of results from each method
             where: Optional metadata filter (may contain unsupported $contains)
             embedding_model_id: ID of the embedding model to use (default: "bge-base")
+            rrf_k: RRF constant (typically 60, controls rank influence)
             
         Returns:
             Combined results dict with documents, metadatas, and distances
+            (1 - RRF score normalized to the best result)
         """
-        from backend.embed_utils import get_embedding
         from backend.metadata_utils import separate_where_clauses, apply_client_side_filters
         
+        cache_key = QueryCache.make_key("query_hybrid", query, k, where, embedding_model_id, rrf_k)
+        cache_generation = self.query_cache.generation
+        cached = self.query_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         # Separate ChromaDB-compatible and client-side filters
         chroma_where, client_where = separate_where_clauses(where)
         
+        # Start sparse retrieval (IDs and scores only); it runs alongside the embedding and
+        # dense query below
+        bm25_future = self._bm25_executor.submit(self._bm25_hits, query, k)
+        
         # Embed query using the configured embedding model
-        query_embedding = get_embedding(query, model_id=embedding_model_id)
+        query_embedding = _embed_query_cached(query, embedding_model_id)
         
         # Get dense retrieval results with ChromaDB-compatible filters only
-        dense_results = self.collection.query(
-            query_embeddings=[query_embedding.tolist()],  # Use query_embeddings, not query_texts!
+        dense_results = self.query_dispatcher.query(
+            query_embeddings=[query_embedding],  # Use query_embeddings, not query_texts!
             n_results=k * 2 if client_where else k,  # Get more if we'll filter client-side
             where=chroma_where,  # Only ChromaDB-compatible filters
         )
@@ -162,11 +376,15 @@ class ChromaClient:
         if client_where:
             dense_results = apply_client_side_filters(dense_results, client_where)
         
-        # Get sparse retrieval results
-        bm25_results = self.query_bm25(query, k=k)
+        # Collect sparse retrieval results, fetching documents only for hits the dense
+        # results did not already return
+        bm25_hits = bm25_future.result()
+        dense_ids = set(dense_results['ids'][0]) if dense_results['ids'] else set()
+        bm25_documents = self._get_documents([doc_id for doc_id, _ in bm25_hits if doc_id not in dense_ids])
         
-        # Combine results (union of document IDs)
-        seen_ids = set()
+        # Combine results (union of document IDs), scoring each by RRF:
+        # score(d) = Σ 1/(rrf_k + rank_i(d)) over the dense and BM25 rankings
+        rrf_scores: Dict[str, float] = {}
         combined_docs = []
         combined_metas = []
         combined_ids = []
@@ -174,30 +392,44 @@ class ChromaClient:
         # Add dense results
         if dense_results['ids'] and dense_results['ids'][0]:
             for i, doc_id in enumerate(dense_results['ids'][0]):
-                if doc_id not in seen_ids:
-                    seen_ids.add(doc_id)
+                if doc_id not in rrf_scores:
+                    rrf_scores[doc_id] = 0.0
                     combined_ids.append(doc_id)
                     combined_docs.append(dense_results['documents'][0][i])
                     combined_metas.append(dense_results['metadatas'][0][i])
+                rrf_scores[doc_id] += 1 / (rrf_k + i + 1)
         
         # Add BM25 results not already included, with client-side filtering if needed
-        for result in bm25_results:
-            if result['id'] not in seen_ids:
-                # Apply client-side filter to BM25 results too
-                if client_where and not self._matches_where_clause(result['metadata'], client_where):
+        client_matches = compile_where(client_where) if client_where else None
+        rank = 0
+        for doc_id, _ in bm25_hits:
+            if doc_id not in rrf_scores:
+                if doc_id not in bm25_documents:
                     continue
-                seen_ids.add(result['id'])
-                combined_ids.append(result['id'])
-                combined_docs.append(result['document'])
-                combined_metas.append(result['metadata'])
+                document, metadata = bm25_documents[doc_id]
+                # Apply client-side filter to BM25 results too (dense results already passed it)
+                if client_matches and not client_matches(metadata):
+                    continue
+                rrf_scores[doc_id] = 0.0
+                combined_ids.append(doc_id)
+                combined_docs.append(document)
+                combined_metas.append(metadata)
+            rank += 1
+            rrf_scores[doc_id] += 1 / (rrf_k + rank)
+        
+        # Order by RRF score (descending; ties keep dense results first)
+        order = sorted(range(len(combined_ids)), key=lambda i: rrf_scores[combined_ids[i]], reverse=True)
+        best = rrf_scores[combined_ids[order[0]]] if order else 1.0
         
         # Format as ChromaDB-style result
-        return {
-            'ids': [combined_ids],
-            'documents': [combined_docs],
-            'metadatas': [combined_metas],
-            'distances': [[0.0] * len(combined_ids)]  # Placeholder, will be re-ranked
+        results = {
+            'ids': [[combined_ids[i] for i in order]],
+            'documents': [[combined_docs[i] for i in order]],
+            'metadatas': [[combined_metas[i] for i in order]],
+            'distances': [[1 - rrf_scores[combined_ids[i]] / best for i in order]]
         }
+        self.query_cache.put(cache_key, results, cache_generation)
+        return results
     
     def query_hybrid_rrf(
         self,
@@ -223,16 +455,24 @@ class ChromaClient:
         Returns:
             Combined results dict with RRF-scored documents
         """
-        from backend.embed_utils import get_embedding
         from backend.metadata_utils import separate_where_clauses, apply_client_side_filters
         
+        cache_key = QueryCache.make_key("query_hybrid_rrf", query, k, where, embedding_model_id, rrf_k)
+        cache_generation = self.query_cache.generation
+        cached = self.query_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         # Separate ChromaDB-compatible and client-side filters
         chroma_where, client_where = separate_where_clauses(where)
         
+        # Start sparse (BM25) retrieval; it runs alongside the dense query below
+        bm25_future = self._bm25_executor.submit(self.query_bm25, query, k * 3 if client_where else k * 2)
+        
         # Get dense (semantic) results with ChromaDB-compatible filters only
-        query_embedding = get_embedding(query, model_id=embedding_model_id)
-        dense_results = self.collection.query(
-            query_embeddings=[query_embedding.tolist()],
+        query_embedding = _embed_query_cached(query, embedding_model_id)
+        dense_results = self.query_dispatcher.query(
+            query_embeddings=[query_embedding],
             n_results=k * 3 if client_where else k * 2,  # Retrieve more for better fusion and filtering
             where=chroma_where,  # Only ChromaDB-compatible filters
         )
@@ -241,8 +481,8 @@ class ChromaClient:
         if client_where:
             dense_results = apply_client_side_filters(dense_results, client_where)
         
-        # Get sparse (BM25) results
-        bm25_results = self.query_bm25(query, k=k * 3 if client_where else k * 2)
+        # Collect sparse (BM25) results
+        bm25_results = bm25_future.result()
         
         # Apply metadata filter to BM25 results if specified
         if chroma_where:
@@ -250,178 +490,122 @@ class ChromaClient:
         
         # Apply client-side filters to BM25 results
         if client_where:
-            bm25_results = [r for r in bm25_results if self._matches_where_clause(r['metadata'], client_where)]
-        
-        # Calculate RRF scores
-        rrf_scores = {}
-        
-        # Add dense rankings
-        if dense_results['ids'] and dense_results['ids'][0]:
-            for rank, doc_id in enumerate(dense_results['ids'][0]):
-                rrf_scores[doc_id] = rrf_scores.get(doc_id, 0) + 1 / (rrf_k + rank + 1)
-        
-        # Add BM25 rankings
-        for rank, result in enumerate(bm25_results):
-            doc_id = result['id']
-            rrf_scores[doc_id] = rrf_scores.get(doc_id, 0) + 1 / (rrf_k + rank + 1)
-        
-        # Sort by RRF score (descending)
-        sorted_ids = sorted(rrf_scores.keys(), key=lambda x: rrf_scores[x], reverse=True)[:k]
-        
-        # Retrieve full documents for top-k IDs
-        if not sorted_ids:
-            return {
-                'ids': [[]],
-                'documents': [[]],
-                'metadatas': [[]],
-                'distances': [[]]
-            }
-        
-        final_results = self.collection.get(
-            ids=sorted_ids,
-            include=['documents', 'metadatas']
-        )
-        
-        # Maintain RRF score order
-        id_to_idx = {doc_id: i for i, doc_id in enumerate(final_results['ids'])}
-        ordered_docs = []
-        ordered_metas = []
-        ordered_scores = []
-        
-        for doc_id in sorted_ids:
-            idx = id_to_idx.get(doc_id)
-            if idx is not None:
-                ordered_docs.append(final_results['documents'][idx])
-                ordered_metas.append(final_results['metadatas'][idx])
-                ordered_scores.append(rrf_scores[doc_id])
-        
-        return {
+            client_matches = compile_where(client_where)
+            bm25_results = [r for r in bm25_results if client_matches(r['metadata'])]
+        
+        # Collect candidates in first-seen order, keeping each one's document and metadata
+        # (both retrievers already returned them, so no second fetch is needed)
+        dense_ids = dense_results['ids'][0] if dense_results['ids'] else []
+        bm25_ids = [result['id'] for result in bm25_results]
+        candidates = {}
+        for rank, doc_id in enumerate(dense_ids):
+            candidates.setdefault(doc_id, (dense_results['documents'][0][rank], dense_results['metadatas'][0][rank]))
+        for result in bm25_results:
+            candidates.setdefault(result['id'], (result['document'], result['metadata']))
+        candidate_ids = list(candidates)
+        
+        # Sum each ranking's 1/(rrf_k + rank) contributions per candidate in one pass
+        slot = {doc_id: i for i, doc_id in enumerate(candidate_ids)}
+        ranks = np.concatenate([np.arange(len(dense_ids)), np.arange(len(bm25_ids))])
+        rrf_scores = np.zeros(len(candidate_ids))
+        slots = np.fromiter((slot[doc_id] for doc_id in dense_ids + bm25_ids), dtype=np.intp, count=len(ranks))
+        np.add.at(rrf_scores, slots, 1.0 / (rrf_k + ranks + 1))
+        
+        # Top k by RRF score (descending; ties keep first-seen order), without sorting every candidate
+        top = np.arange(len(candidate_ids))
+        if k < len(top):
+            kth = -np.partition(-rrf_scores, k - 1)[k - 1]
+            above = np.flatnonzero(rrf_scores > kth)
+            top = np.sort(np.concatenate([above, np.flatnonzero(rrf_scores == kth)[:k - len(above)]]))
+        top = top[np.argsort(-rrf_scores[top], kind="stable")]
+        sorted_ids = [candidate_ids[i] for i in top]
+        
+        # Documents and metadata in RRF score order
+        results = {
             'ids': [sorted_ids],
-            'documents': [ordered_docs],
-            'metadatas': [ordered_metas],
-            'distances': [[1 - score for score in ordered_scores]]  # Convert to distance
+            'documents': [[candidates[doc_id][0] for doc_id in sorted_ids]],
+            'metadatas': [[candidates[doc_id][1] for doc_id in sorted_ids]],
+            'distances': [(1 - rrf_scores[top]).tolist()]  # Convert to distance
         }
+        self.query_cache.put(cache_key, results, cache_generation)
+        return results
     
     def _filter_bm25_results(self, results: List[Dict], where: Dict[str, Any]) -> List[Dict]:
         """Filter BM25 results by metadata constraints."""
-        filtered = []
-        
-        for result in results:
-            metadata = result.get('metadata', {})
-            if self._matches_where_clause(metadata, where):
-                filtered.append(result)
-        
-        return filtered
+        matches = compile_where(where)
+        return [result for result in results if matches(result.get('metadata', {}))]
     
     def _matches_where_clause(self, metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
-        """Check if metadata matches a where clause."""
-        # Simple implementation - can be extended for complex clauses
-        for key, condition in where.items():
-            if key == "$and":
-                # All conditions must match
-                return all(self._matches_where_clause(metadata, c) for c in condition)
-            elif key == "$or":
-                # Any condition must match
-                return any(self._matches_where_clause(metadata, c) for c in condition)
-            elif key == "$not":
-                # Condition must not match
-                return not self._matches_where_clause(metadata, condition)
-            elif isinstance(condition, dict):
-                # Field condition (e.g., {"year": {"$gte": 2020}})
-                field_value = metadata.get(key)
-                if field_value is None:
-                    return False
-                
-                for op, target in condition.items():
-                    if op == "$eq":
-                        if field_value != target:
-                            return False
-                    elif op == "$ne":
-                        if field_value == target:
-                            return False
-                    elif op == "$gt":
-                        if not (field_value > target):
-                            return False
-                    elif op == "$gte":
-                        if not (field_value >= target):
-                            return False
-                    elif op == "$lt":
-                        if not (field_value < target):
-                            return False
-                    elif op == "$lte":
-                        if not (field_value <= target):
-                            return False
-                    elif op == "$contains":
-                        if target not in str(field_value):
-                            return False
-                    elif op == "$in":
-                        if field_value not in target:
-                            return False
-                    elif op == "$nin":
-                        if field_value in target:
-                            return False
-            else:
-                # Direct equality check
-                if metadata.get(key) != condition:
-                    return False
+        """Check if metadata matches a where clause.
         
-        return True
+        To filter many rows, compile the clause once with compile_where() instead.
+        """
+        return compile_where(where)(metadata)
+    
+    @staticmethod
+    def _new_bm25_tokenizer() -> Tokenizer:
+        """Tokenizer for BM25 (lowercased words, English stopwords removed)."""
+        return Tokenizer(stopwords="en")
     
     def _load_bm25_index(self):
         """Load BM25 index from disk if it exists."""
-        if os.path.exists(self.bm25_path):
+        if os.path.exists(os.path.join(self.bm25_path, "ids.json")) and \
+                os.path.exists(os.path.join(self.bm25_path, BM25_VOCAB_FILE)):
             try:
-                with open(self.bm25_path, 'rb') as f:
-                    data = pickle.load(f)
-                    self.bm25_index = data['index']
-                    self.bm25_corpus = data['corpus']
-                    self.bm25_ids = data['ids']
+                self.bm25_index = bm25s.BM25.load(self.bm25_path, mmap=True, backend=BM25_BACKEND, show_progress=False)
+                self.bm25_tokenizer = self._new_bm25_tokenizer()
+                self.bm25_tokenizer.load_vocab(self.bm25_path, BM25_VOCAB_FILE)
+                with open(os.path.join(self.bm25_path, "ids.json")) as f:
+                    self.bm25_ids = np.asarray(json.load(f), dtype=object)
             except Exception as e:
                 print(f"Error loading BM25 index: {e}")
                 self.bm25_index = None
+        elif os.path.isdir(self.bm25_path) or os.path.exists(self._legacy_bm25_path):
+            # Rebuild indexes saved by rank_bm25, or without a tokenizer vocabulary
+            print("Converting legacy BM25 index...")
+            self.build_bm25_index()
+            if self.bm25_index is not None and os.path.exists(self._legacy_bm25_path):
+                os.remove(self._legacy_bm25_path)
     
     def _save_bm25_index(self):
         """Save BM25 index to disk."""
         if self.bm25_index is not None:
             try:
-                with open(self.bm25_path, 'wb') as f:
-                    pickle.dump({
-                        'index': self.bm25_index,
-                        'corpus': self.bm25_corpus,
-                        'ids': self.bm25_ids
-                    }, f)
+                self.bm25_index.save(self.bm25_path)
+                self.bm25_tokenizer.save_vocab(self.bm25_path, BM25_VOCAB_FILE)
+                with open(os.path.join(self.bm25_path, "ids.json"), "w") as f:
+                    json.dump(self.bm25_ids.tolist(), f)
             except Exception as e:
                 print(f"Error saving BM25 index: {e}")
     
     def build_bm25_index(self):
         """Build BM25 index from all documents in ChromaDB."""
-        # Get all documents from ChromaDB
-        total_count = self.collection.count()
-        
-        if total_count == 0:
-            print("No documents in collection to index")
-            return
-        
-        all_docs = self.collection.get(limit=total_count)
+        # Get all documents from ChromaDB (text only, a page at a time)
+        all_docs = {'ids': [], 'documents': []}
+        for page in self.iter_collection_pages(include=['documents']):
+            all_docs['ids'] += page['ids']
+            all_docs['documents'] += page['documents']
         
         if not all_docs['ids']:
             print("No documents in collection to index")
             return
         
-        # Tokenize documents (simple whitespace tokenization)
-        corpus = []
-        for doc in all_docs['documents']:
-            tokens = doc.lower().split()
-            corpus.append(tokens)
+        # Tokenize documents into token IDs (building the vocabulary in one pass)
+        # and precompute BM25 scores into a sparse matrix
+        tokenizer = self._new_bm25_tokenizer()
+        tokens = tokenizer.tokenize(all_docs['documents'], return_as="tuple", show_progress=False)
+        index = bm25s.BM25(backend=BM25_BACKEND)
+        index.index(tokens, show_progress=False)
         
         # Build BM25 index
-        self.bm25_corpus = corpus
-        self.bm25_ids = all_docs['ids']
-        self.bm25_index = BM25Okapi(corpus)
+        self.bm25_ids = np.asarray(all_docs['ids'], dtype=object)
+        self.bm25_index = index
+        self.bm25_tokenizer = tokenizer
         
         # Save index
         self._save_bm25_index()
-        print(f"BM25 index built with {len(corpus)} documents")
+        self.query_cache.clear()
+        print(f"BM25 index built with {len(self.bm25_ids)} documents")
 
     def sync_db(self,
         items: Iterable[Any],  
@@ -432,71 +616,84 @@ class ChromaClient:
         """
         Syncs the Chroma DB with the current ZoteroItem snapshot.
         Indexes and chunks text, embeds with supplied function, and stores metadata.
+        Items that already have chunks in the database are skipped.
+        embed_fn should embed a batch (List[str] -> List[List[float]]); see embed_chunks_batch.
         """
 
         def chunk_text(t: str, size: int, overlap: int) -> List[str]:
-            chunks = []
-            start = 0
+            # Chunks start every size - overlap characters; the last one is the
+            # first that reaches the end of the text
             n = len(t)
-            while start < n:
-                end = min(n, start + size)
-                chunks.append(t[start:end])
-                if end == n:
-                    break
-                start = end - overlap
-            return chunks
+            if not n:
+                return []
+            return [t[start:start + size] for start in range(0, max(n - overlap, 1), size - overlap)]
+
+        def iter_items():
+            """Yield (item, text, item_id) for every item with text."""
+            for item in items:
+                text = getattr(item, "metadata", {}).get("text") or item.get("text") if isinstance(item, dict) else None
+                item_id = getattr(item, "metadata", {}).get("item_id") or item.get("item_id") if isinstance(item, dict) else None
+                if not text or not item_id:
+                    continue
+                yield item, text, str(item_id)
+
+        def iter_chunks():
+            """Yield (id, document, metadata) for every chunk of items not indexed yet."""
+            pending = iter_items()
+            # Check which items are already indexed one group of items (one query) at a time
+            for group in iter(lambda: list(islice(pending, self.sync_batch_size)), []):
+                indexed = self.items_exist(item_id for _, _, item_id in group)
+                for item, text, item_id in group:
+                    if item_id in indexed:
+                        continue
+                    yield from item_chunks(item, text, item_id)
+
+        def item_chunks(item, text: str, item_id: str):
+            """Yield (id, document, metadata) for each chunk of one item."""
+            meta_src = getattr(item, "metadata", {}) if hasattr(item, "metadata") else item
+            # Item-level metadata is the same for every chunk, so look it up once
+            base_meta = {
+                "item_id": item_id,
+                "title": meta_src.get("title") or "",
+                "authors": meta_src.get("authors") or "",
+                "tags": meta_src.get("tags") or "",
+                "collections": meta_src.get("collections") or "",
+                "year": meta_src.get("date") or "",
+                "pdf_path": meta_src.get("pdf_path") or "",
+            }
+            for idx, ch in enumerate(chunk_text(text, chunk_size, chunk_overlap)):
+                yield f"{item_id}:{idx}", ch, {**base_meta, "chunk_idx": idx}
 
         ids: List[str] = []
         docs: List[str] = []
         metas: List[Dict[str, Any]] = []
-        embeddings: List[List[float]] = []
+        # add_chunks of the previous batch, running on the writer thread while
+        # the next batch is embedded
+        pending: Optional[Future] = None
 
-        for item in items:
-            text = getattr(item, "metadata", {}).get("text") or item.get("text") if isinstance(item, dict) else None
-            item_id = getattr(item, "metadata", {}).get("item_id") or item.get("item_id") if isinstance(item, dict) else None
-            if not text or not item_id:
-                continue
-            chunks = chunk_text(text, chunk_size, chunk_overlap)
-            meta_src = getattr(item, "metadata", {}) if hasattr(item, "metadata") else item
-            ids_batch = []
-            docs_batch = []
-            metas_batch = []
-            for idx, ch in enumerate(chunks):
-                doc_id = f"{str(item_id)}:{str(idx)}"
-                ids_batch.append(doc_id)
-                docs_batch.append(ch)
-
-                title = meta_src.get("title") or ""
-                authors = meta_src.get("authors") or ""
-                tags = meta_src.get("tags") or ""
-                collections = meta_src.get("collections") or ""
-                year = meta_src.get("date") or ""
-                pdf_path = meta_src.get("pdf_path") or ""
-
-                metas_batch.append({
-                    "item_id": str(item_id),
-                    "chunk_idx": int(idx),
-                    "title": title,
-                    "authors": authors,
-                    "tags": tags,
-                    "collections": collections,
-                    "year": year,
-                    "pdf_path": pdf_path,
-                })
-            ids += ids_batch
-            docs += docs_batch
-            metas += metas_batch
+        def flush():
+            nonlocal ids, docs, metas, pending
             # ----- Embed batch -----
-            if embed_fn is not None and docs_batch:
-                embeddings += self.embed_chunks(docs_batch, embed_fn)
-        if ids:
-            print("ID types:", set(type(i) for i in ids))
-            self.add_chunks(
-                ids=[str(i) for i in ids],
-                documents=docs,
-                metadatas=metas,
-                embeddings=embeddings if embed_fn is not None else None
-            )
+            embeddings = self.embed_chunks_cached(docs, embed_fn) if embed_fn is not None else None
+            # ----- Store batch (one write in flight at a time) -----
+            if pending is not None:
+                pending.result()
+            pending = writer.submit(self.add_chunks, ids=ids, documents=docs, metadatas=metas, embeddings=embeddings)
+            ids, docs, metas = [], [], []
+
+        # Add in batches of sync_batch_size chunks rather than one huge call, so
+        # memory stays bounded on large libraries
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            for doc_id, doc, meta in iter_chunks():
+                ids.append(doc_id)
+                docs.append(doc)
+                metas.append(meta)
+                if len(ids) >= self.sync_batch_size:
+                    flush()
+            if ids:
+                flush()
+            if pending is not None:
+                pending.result()  # Surface errors from the last write
 
     def get_or_create_db(self):
         """
@@ -505,8 +702,10 @@ class ChromaClient:
         """
         self.collection = self.chroma_client.get_or_create_collection(
             name=self.collection_name,
-            metadata={"hnsw:space": "cosine"}
+            metadata=self._collection_metadata
         )
+        self._indexed_ids_cache = None
+        self.query_cache.clear()
     
     def count_items_matching_filters(
         self,
@@ -550,40 +749,29 @@ class ChromaClient:
         
         if where is None:
             # No filters - count everything
-            total_count = self.collection.count()
-            all_results = self.collection.get(limit=total_count if total_count > 0 else 1, include=['metadatas'])
-            unique_items = len({str(m.get('item_id')) for m in all_results.get('metadatas', [])})
             return {
-                'unique_items': unique_items,
-                'total_chunks': len(all_results.get('ids', []))
+                'unique_items': len(self.get_indexed_item_ids()),
+                'total_chunks': self.collection.count()
             }
         
         # Separate ChromaDB-compatible and client-side filters
         chroma_where, client_where = separate_where_clauses(where)
+        client_matches = compile_where(client_where) if client_where else None
         
-        # Get total count to ensure we fetch all documents
-        total_count = self.collection.count()
-        
-        # Get all results matching ChromaDB filters (specify limit to get all)
-        if chroma_where:
-            results = self.collection.get(where=chroma_where, limit=total_count if total_count > 0 else 1, include=['metadatas'])
-        else:
-            # No ChromaDB filters, get everything
-            results = self.collection.get(limit=total_count if total_count > 0 else 1, include=['metadatas'])
-        
-        # Apply client-side filtering if needed
-        if client_where:
-            metadatas = results.get('metadatas', [])
-            filtered_metas = [m for m in metadatas if self._matches_where_clause(m, client_where)]
-        else:
-            filtered_metas = results.get('metadatas', [])
-        
-        # Count unique items
-        unique_items = len({str(m.get('item_id')) for m in filtered_metas if m.get('item_id')})
+        # Scan metadata of chunks matching the ChromaDB filters a page at a time,
+        # applying client-side filters and keeping only the counts
+        item_ids = set()
+        total_chunks = 0
+        for page in self.iter_collection_pages(include=['metadatas'], where=chroma_where):
+            metadatas = page['metadatas']
+            if client_matches:
+                metadatas = [m for m in metadatas if client_matches(m)]
+            total_chunks += len(metadatas)
+            item_ids.update(str(m['item_id']) for m in metadatas if m.get('item_id'))
         
         return {
-            'unique_items': unique_items,
-            'total_chunks': len(filtered_metas)
+            'unique_items': len(item_ids),
+            'total_chunks': total_chunks
         }
     
     def get_indexed_item_ids(self) -> set:
@@ -593,31 +781,35 @@ class ChromaClient:
         Returns:
             Set of item_id strings (always converted to strings for consistency)
         """
-        # Get total count first to ensure we fetch ALL documents
-        # ChromaDB's get() has a default limit, so we must specify a sufficient limit
-        total_count = self.collection.count()
-        
-        if total_count == 0:
-            return set()
-        
-        # Get all documents with their metadata (specify limit to get ALL docs)
-        all_data = self.collection.get(
-            limit=total_count,
-            include=['metadatas']
-        )
-        
-        if not all_data['metadatas']:
-            return set()
-        
-        # Extract unique item_ids from metadata
+        # Extract unique item_ids from metadata, a page of chunks at a time
         # IMPORTANT: Always convert to string for consistent comparison with Zotero IDs
         item_ids = set()
-        for metadata in all_data['metadatas']:
-            if metadata and 'item_id' in metadata:
-                item_ids.add(str(metadata['item_id']))
+        for page in self.iter_collection_pages(include=['metadatas']):
+            for metadata in page['metadatas']:
+                if metadata and 'item_id' in metadata:
+                    item_ids.add(str(metadata['item_id']))
         
+        self._indexed_ids_cache = set(item_ids)
         return item_ids
     
+    def iter_collection_pages(
+        self,
+        include: List[str],
+        where: Optional[Dict[str, Any]] = None,
+        page_size: int = GET_PAGE_SIZE,
+    ) -> Iterable[Dict[str, Any]]:
+        """
+        Yield collection.get() results for the whole collection (or the chunks matching
+        where), page_size chunks at a time, so large libraries are never pulled through
+        Python in one call.
+        """
+        total_count = self.collection.count()
+        for offset in range(0, total_count, page_size):
+            page = self.collection.get(where=where, limit=page_size, offset=offset, include=include)
+            if not page['ids']:
+                break
+            yield page
+    
     def item_exists(self, item_id: str) -> bool:
         """
         Check if an item is already indexed in the database.
@@ -628,12 +820,30 @@ class ChromaClient:
         Returns:
             True if item exists, False otherwise
         """
-        # Query for any chunk with this item_id
+        # Look up the in-memory set of indexed items (loaded once) instead of
+        # querying ChromaDB per item
+        if self._indexed_ids_cache is None:
+            self.get_indexed_item_ids()
+        return str(item_id) in self._indexed_ids_cache
+    
+    def items_exist(self, item_ids: Iterable[str]) -> Set[str]:
+        """
+        Check which of several items are already indexed, with a single query.
+        
+        Args:
+            item_ids: Zotero item IDs to check
+            
+        Returns:
+            Set of the given item IDs (as strings) that have chunks in the database
+        """
+        item_ids = list(dict.fromkeys(str(i) for i in item_ids))
+        if not item_ids:
+            return set()
         results = self.collection.get(
-            where={"item_id": str(item_id)},
-            limit=1
+            where={"item_id": {"$in": item_ids}},
+            include=['metadatas']
         )
-        return len(results['ids']) > 0
+        return {str(m['item_id']) for m in results['metadatas'] if m and 'item_id' in m}
     
     def get_item_metadata(self, item_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -664,17 +874,19 @@ class ChromaClient:
         Returns:
             Number of chunks deleted
         """
-        # Get all chunk IDs for this item
-        # Use high limit to ensure we get all chunks for this item
-        total_count = self.collection.count()
-        results = self.collection.get(
-            where={"item_id": str(item_id)},
-            limit=total_count if total_count > 0 else 1
-        )
-        
-        if results['ids']:
-            self.collection.delete(ids=results['ids'])
-            return len(results['ids'])
+        # Get all chunk IDs for this item (IDs only, page by page), before deleting any
+        chunk_ids = [
+            chunk_id
+            for page in self.iter_collection_pages(include=[], where={"item_id": str(item_id)})
+            for chunk_id in page['ids']
+        ]
+        
+        if chunk_ids:
+            self.collection.delete(ids=chunk_ids)
+            self.query_cache.clear()
+            if self._indexed_ids_cache is not None:
+                self._indexed_ids_cache.discard(str(item_id))
+            return len(chunk_ids)
         return 0
 
     def embed_chunks(self, chunks: List[str], embed_fn) -> List[List[float]]:
@@ -683,6 +895,70 @@ class ChromaClient:
         """
         embeddings = [embed_fn(chunk) for chunk in chunks]
         return embeddings
+
+    def embed_chunks_batch(self, chunks: List[str], embed_fn, batch_size: int = 64) -> List[List[float]]:
+        """
+        Embeds text chunks with one embed_fn call per batch of up to batch_size chunks,
+        so the model can encode each batch in a single forward pass.
+        
+        embed_fn should map List[str] -> List[List[float]]. An embed_fn that only takes a
+        single string (str -> List[float]) is detected and called once per chunk instead.
+        """
+        embeddings: List[List[float]] = []
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            try:
+                vectors = embed_fn(batch)
+            except (TypeError, ValueError, AttributeError):
+                vectors = None
+            if vectors is None or np.ndim(vectors) != 2 or len(vectors) != len(batch):
+                # Scalar embed_fn: fall back to per-chunk calls for the rest
+                return embeddings + self.embed_chunks(chunks[start:], embed_fn)
+            embeddings.extend(vectors)
+        return embeddings
+    
+    def _get_emb_cache(self) -> sqlite3.Connection:
+        """Get or open the embedding cache connection (call with _emb_cache_lock held)."""
+        if self._emb_cache_conn is None:
+            conn = sqlite3.connect(self.emb_cache_path, check_same_thread=False)
+            conn.execute("CREATE TABLE IF NOT EXISTS emb_cache (hash TEXT PRIMARY KEY, vec BLOB)")
+            self._emb_cache_conn = conn
+        return self._emb_cache_conn
+    
+    def embed_chunks_cached(self, chunks: List[str], embed_fn) -> List[np.ndarray]:
+        """
+        Embeds text chunks like embed_chunks_batch, reusing cached vectors for chunks whose
+        text (sha256) was embedded before with this collection's embedding model.
+        Vectors are stored as EMB_CACHE_DTYPE and returned as float32 arrays, which
+        ChromaDB accepts directly; freshly embedded chunks keep full precision.
+        """
+        hashes = [hashlib.sha256(chunk.encode("utf-8")).hexdigest() for chunk in chunks]
+        
+        # Look up all hits in one query
+        unique_hashes = list(dict.fromkeys(hashes))
+        placeholders = ",".join("?" * len(unique_hashes))
+        with self._emb_cache_lock:
+            rows = self._get_emb_cache().execute(
+                f"SELECT hash, vec FROM emb_cache WHERE hash IN ({placeholders})", unique_hashes
+            ).fetchall()
+        cached = {h: np.frombuffer(vec, dtype=EMB_CACHE_DTYPE).astype(np.float32) for h, vec in rows}
+        
+        # Embed each missing text once (outside the lock, so other threads can read the cache)
+        missing = {h: chunk for h, chunk in zip(hashes, chunks) if h not in cached}
+        if missing:
+            # Fresh vectors go to ChromaDB at full precision; only the cached copy is narrowed
+            vectors = [np.asarray(vec, dtype=np.float32)
+                       for vec in self.embed_chunks_batch(list(missing.values()), embed_fn)]
+            with self._emb_cache_lock:
+                conn = self._get_emb_cache()
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO emb_cache (hash, vec) VALUES (?, ?)",
+                        [(h, vec.astype(EMB_CACHE_DTYPE).tobytes()) for h, vec in zip(missing, vectors)]
+                    )
+            cached.update(zip(missing, vectors))
+        
+        return [cached[h] for h in hashes]
     
     def get_document_count(self) -> int:
         """
@@ -700,7 +976,7 @@ class ChromaClient:
         Returns:
             Dict with validation results including expected vs actual dimensions
         """
-        from backend.embed_utils import get_embedding, get_embedding_dimension, get_current_model_id
+        embed_utils = _embed_utils()
         
         # Try to get a sample document to check dimensions
         sample = self.collection.get(limit=1)
@@ -709,18 +985,18 @@ class ChromaClient:
             return {
                 "status": "empty",
                 "message": "Database is empty. Re-indexing required.",
-                "expected_dimension": get_embedding_dimension(),
-                "model": get_current_model_id()
+                "expected_dimension": embed_utils.get_embedding_dimension(),
+                "model": embed_utils.get_current_model_id()
             }
         
         # Test embedding a simple query
-        test_embedding = get_embedding("test query")
+        test_embedding = embed_utils.get_embedding("test query")
         
         return {
             "status": "ok",
             "message": "Database configuration is valid",
-            "expected_dimension": get_embedding_dimension(),
+            "expected_dimension": embed_utils.get_embedding_dimension(),
             "actual_dimension": len(test_embedding),
-            "model": get_current_model_id(),
+            "model": embed_utils.get_current_model_id(),
             "document_count": len(sample['ids'])
         }
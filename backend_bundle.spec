@@ -19,6 +19,8 @@ hiddenimports = [
     'uvicorn.protocols',
     'uvicorn.protocols.http',
     'uvicorn.protocols.http.auto',
+    'uvicorn.protocols.http.httptools_impl',
+    'httptools',
     'uvicorn.protocols.websockets',
     'uvicorn.protocols.websockets.auto',
     'uvicorn.lifespan',
@@ -49,6 +51,10 @@ hiddenimports = [
     'typing_extensions',
 ]
 
+# uvloop event loop (not available on Windows); selected explicitly in backend_server_main.py
+if sys.platform != 'win32':
+    hiddenimports += ['uvloop', 'uvicorn.loops.uvloop']
+
 # Collect additional hidden imports for Chroma and sentence-transformers
 hiddenimports += collect_submodules('chromadb')
 hiddenimports += collect_submodules('sentence_transformers')
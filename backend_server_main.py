@@ -4,64 +4,94 @@ Backend server wrapper for PyInstaller bundle
 This script starts the FastAPI backend server with uvicorn
 Accepts port as a command-line argument to match Electron's expectations
 """
+import argparse
+import os
 import sys
 import socket
+from typing import Callable
 import uvicorn
 
-def is_port_available(host: str, port: int) -> bool:
-    """Check if a port is available for binding"""
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind((host, port))
-            return True
-    except OSError:
-        return False
-
-def find_available_port(host: str, preferred_port: int = 8000, max_tries: int = 10) -> int:
-    """Find an available port starting from the preferred port"""
+def make_listen_socket(host: str, preferred_port: int = 8000, max_tries: int = 10,
+                       log: Callable[[str], None] = print) -> tuple[socket.socket, int]:
+    """Bind and listen on the first available port starting from the preferred port.
+    
+    A preferred port of 0 lets the OS assign a free port in a single bind. The bound
+    socket is handed to uvicorn as-is, so no other process can take the port between
+    finding it and serving on it. Progress messages are passed to log.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Allow rebinding a port left in TIME_WAIT by a previous run (on Windows this
+    # option would let us bind a port another process is listening on, so skip it there)
+    if sys.platform != "win32":
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if preferred_port == 0:
+        sock.bind((host, 0))
+        sock.listen(2048)
+        return sock, sock.getsockname()[1]
     for i in range(max_tries):
         port = preferred_port + i
-        if is_port_available(host, port):
-            if port != preferred_port:
-                print(f"Port {preferred_port} unavailable, using port {port} instead")
-            return port
-        print(f"Port {port} is in use, trying next...")
+        try:
+            sock.bind((host, port))
+        except OSError:
+            continue
+        if port != preferred_port:
+            busy = f"Ports {preferred_port}-{port - 1}" if port - 1 > preferred_port else f"Port {preferred_port}"
+            log(f"{busy} unavailable, using port {port} instead")
+        sock.listen(2048)
+        return sock, port
     
+    sock.close()
     raise RuntimeError(f"Could not find an available port in range {preferred_port}-{preferred_port + max_tries - 1}")
 
 def main():
-    # Parse command line arguments
-    port = 8000  # default port
-    host = "127.0.0.1"
+    # Parse command line arguments (unknown arguments are ignored)
+    parser = argparse.ArgumentParser(description="Zotero RAG Assistant backend server")
+    parser.add_argument("--port", type=int, default=8000, help="Port to serve on (0 = any free port)")
+    parser.add_argument("--host", default="127.0.0.1")
+    args, _ = parser.parse_known_args()
+    port, host = args.port, args.host
+    max_tries = 10
+    
+    # Electron sets ZOTERO_RAG_PORT to the port it has already checked and will connect
+    # to, so serve exactly that port instead of scanning for another one
+    env_port = os.environ.get("ZOTERO_RAG_PORT")
+    if env_port:
+        try:
+            port, max_tries = int(env_port), 1
+        except ValueError:
+            print(f"ERROR: ZOTERO_RAG_PORT must be a port number, got {env_port!r}", file=sys.stderr)
+            sys.exit(1)
     
-    # Simple argument parsing
-    args = sys.argv[1:]
-    for i, arg in enumerate(args):
-        if arg == '--port' and i + 1 < len(args):
-            port = int(args[i + 1])
-        elif arg == '--host' and i + 1 < len(args):
-            host = args[i + 1]
+    # Startup messages are written to Electron's pipe in one write (stdout is unbuffered)
+    banner = []
     
-    # Find an available port if the requested one is in use
+    # Bind an available port if the requested one is in use
     try:
-        available_port = find_available_port(host, port)
+        sock, available_port = make_listen_socket(host, port, max_tries, log=banner.append)
     except RuntimeError as e:
+        sys.stdout.write("".join(f"{line}\n" for line in banner))
         print(f"ERROR: {e}", file=sys.stderr)
         sys.exit(1)
     
-    print(f"Starting Zotero RAG Assistant backend server on {host}:{available_port}")
-    print(f"PyInstaller bundle - Python {sys.version}")
+    banner.append(f"Starting Zotero RAG Assistant backend server on {host}:{available_port}")
+    banner.append(f"PyInstaller bundle - Python {sys.version}")
+    sys.stdout.write("".join(f"{line}\n" for line in banner))
+    sys.stdout.flush()
     
     # Import the app directly (not as a string) so PyInstaller can find it
     from backend.main import app
     
-    # Run uvicorn with the FastAPI app object
-    uvicorn.run(
+    # Run uvicorn with the FastAPI app object on the already-bound socket, using the
+    # libuv event loop (unsupported on Windows) and the C HTTP parser
+    config = uvicorn.Config(
         app,
         host=host,
         port=available_port,
-        log_level="info"
+        log_level="info",
+        loop="uvloop" if sys.platform != "win32" else "asyncio",
+        http="httptools",
     )
+    uvicorn.Server(config).run(sockets=[sock])
 
 if __name__ == "__main__":
     main()
@@ -1050,6 +1050,8 @@ async function startBackend(): Promise<boolean> {
       ...process.env,
       PYTHONUNBUFFERED: '1',
       PYTHONIOENCODING: 'utf-8',
+      // Port already checked above; the bundled backend serves exactly this port
+      ZOTERO_RAG_PORT: BACKEND_PORT.toString(),
       // Ensure Python can find the bundled libraries in production
       ...((!IS_DEV && process.platform === 'darwin') ? {
         DYLD_LIBRARY_PATH: path.join(process.resourcesPath, 'python', 'lib')
@@ -4,14 +4,21 @@ Quick test script for Google Gemini provider.
 Tests single-turn and multi-turn conversations.
 """
 
+import asyncio
 import sys
 import os
+import traceback
+from pathlib import Path
 
 # Add backend to path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
 
 from model_providers import get_provider, Message
 
+# System prompts shared by the test requests
+SYSTEM_BRIEF = Message(role="system", content="You are a helpful assistant. Answer briefly.")
+SYSTEM_RAG = Message(role="system", content="You are an academic research assistant. Answer based on the provided context and cite sources using [N] format.")
+
 def test_google_provider():
     """Test Google Gemini provider with sample messages."""
     
@@ -36,109 +43,102 @@ def test_google_provider():
     credentials = {"api_key": api_key}
     print(f"✓ API key found (length: {len(api_key)})")
     
+    # The three requests are independent, so send them concurrently and report in order
+    context = """
+        [1] Smith et al. (2020) found that machine learning models perform better with larger datasets.
+        [2] Johnson (2021) showed that proper validation is crucial for model evaluation.
+        [3] Lee and Park (2022) demonstrated improved accuracy using ensemble methods.
+        """
+    requests = [
+        # Test 1: Single turn
+        ([
+            SYSTEM_BRIEF,
+            Message(role="user", content="What is 2+2? Answer in one sentence.")
+        ], 100),
+        # Test 2: Multi-turn
+        ([
+            SYSTEM_BRIEF,
+            Message(role="user", content="What is the capital of France?"),
+            Message(role="assistant", content="The capital of France is Paris."),
+            Message(role="user", content="What is its population?")
+        ], 100),
+        # Test 3: Long context (RAG-like)
+        ([
+            SYSTEM_RAG,
+            Message(role="user", content=f"Based on the following research:\n{context}\n\nQuestion: What improves model performance?")
+        ], 200),
+    ]
+    
+    async def run_all():
+        return await asyncio.gather(*(
+            asyncio.to_thread(
+                provider.chat,
+                credentials=credentials,
+                model="gemini-1.5-flash-latest",  # Use faster model for testing
+                messages=messages,
+                temperature=0.3,
+                max_tokens=max_tokens
+            )
+            for messages, max_tokens in requests
+        ), return_exceptions=True)
+    
+    responses = asyncio.run(run_all())
+    
     # Test 1: Single turn
     print("\n" + "-"*80)
     print("Test 1: Single-turn conversation")
     print("-"*80)
     
-    try:
-        messages = [
-            Message(role="system", content="You are a helpful assistant. Answer briefly."),
-            Message(role="user", content="What is 2+2? Answer in one sentence.")
-        ]
-        
-        response = provider.chat(
-            credentials=credentials,
-            model="gemini-1.5-flash-latest",  # Use faster model for testing
-            messages=messages,
-            temperature=0.3,
-            max_tokens=100
-        )
-        
-        print(f"✓ Response received ({len(response.content)} chars)")
-        print(f"  Content: {response.content[:200]}")
-        print(f"  Model: {response.model}")
-        if response.usage:
-            print(f"  Tokens: {response.usage}")
-        
-    except Exception as e:
-        print(f"✗ Test 1 FAILED: {e}")
-        import traceback
-        traceback.print_exc()
+    response = responses[0]
+    if isinstance(response, Exception):
+        print(f"✗ Test 1 FAILED: {response}")
+        traceback.print_exception(response)
         return False
     
+    print(f"✓ Response received ({len(response.content)} chars)")
+    print(f"  Content: {response.content[:200]}")
+    print(f"  Model: {response.model}")
+    if response.usage:
+        print(f"  Tokens: {response.usage}")
+    
     # Test 2: Multi-turn
     print("\n" + "-"*80)
     print("Test 2: Multi-turn conversation")
     print("-"*80)
     
-    try:
-        messages = [
-            Message(role="system", content="You are a helpful assistant. Answer briefly."),
-            Message(role="user", content="What is the capital of France?"),
-            Message(role="assistant", content="The capital of France is Paris."),
-            Message(role="user", content="What is its population?")
-        ]
-        
-        response = provider.chat(
-            credentials=credentials,
-            model="gemini-1.5-flash-latest",
-            messages=messages,
-            temperature=0.3,
-            max_tokens=100
-        )
-        
-        print(f"✓ Response received ({len(response.content)} chars)")
-        print(f"  Content: {response.content[:200]}")
-        
-    except Exception as e:
-        print(f"✗ Test 2 FAILED: {e}")
-        import traceback
-        traceback.print_exc()
+    response = responses[1]
+    if isinstance(response, Exception):
+        print(f"✗ Test 2 FAILED: {response}")
+        traceback.print_exception(response)
         return False
     
+    print(f"✓ Response received ({len(response.content)} chars)")
+    print(f"  Content: {response.content[:200]}")
+    
     # Test 3: Long context (RAG-like)
     print("\n" + "-"*80)
     print("Test 3: RAG-style context")
     print("-"*80)
     
-    try:
-        context = """
-        [1] Smith et al. (2020) found that machine learning models perform better with larger datasets.
-        [2] Johnson (2021) showed that proper validation is crucial for model evaluation.
-        [3] Lee and Park (2022) demonstrated improved accuracy using ensemble methods.
-        """
-        
-        messages = [
-            Message(role="system", content="You are an academic research assistant. Answer based on the provided context and cite sources using [N] format."),
-            Message(role="user", content=f"Based on the following research:\n{context}\n\nQuestion: What improves model performance?")
-        ]
-        
-        response = provider.chat(
-            credentials=credentials,
-            model="gemini-1.5-flash-latest",
-            messages=messages,
-            temperature=0.3,
-            max_tokens=200
-        )
-        
-        print(f"✓ Response received ({len(response.content)} chars)")
-        print(f"  Content: {response.content}")
-        
-        # Check if it's actually an answer and not just returning the context
-        if len(response.content) < 50:
-            print(f"⚠ WARNING: Response seems too short, might be returning snippets")
-        elif context[:100] in response.content:
-            print(f"⚠ WARNING: Response contains raw context, might be echoing instead of answering")
-        else:
-            print(f"✓ Response appears to be a proper synthesis")
-        
-    except Exception as e:
-        print(f"✗ Test 3 FAILED: {e}")
-        import traceback
-        traceback.print_exc()
+    response = responses[2]
+    if isinstance(response, Exception):
+        print(f"✗ Test 3 FAILED: {response}")
+        traceback.print_exception(response)
         return False
     
+    print(f"✓ Response received ({len(response.content)} chars)")
+    print(f"  Content: {response.content}")
+    
+    # Check if it's actually an answer and not just returning the context
+    # (compare with whitespace collapsed, so re-indented or re-wrapped echoes are caught)
+    echo_needle = " ".join(context.split())[:64]
+    if len(response.content) < 50:
+        print(f"⚠ WARNING: Response seems too short, might be returning snippets")
+    elif echo_needle in " ".join(response.content.split()):
+        print(f"⚠ WARNING: Response contains raw context, might be echoing instead of answering")
+    else:
+        print(f"✓ Response appears to be a proper synthesis")
+    
     print("\n" + "="*80)
     print("All tests passed! ✓")
     print("="*80)